@@ -1,20 +1,79 @@
+import argparse
+import asyncio
+import hashlib
 import wikipediaapi
-from openai import OpenAI
+import httpx
+from openai import OpenAI, AsyncOpenAI
 import requests
 import time
 from langcodes import Language
 import config
 import os
 import tiktoken
+from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
 load_dotenv()
 
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-)
+client = None
+async_client = None
+encoding = None
+alphabet_model = "gpt-4o"
+cache_folder = "alphabet_cache"
+
+def get_client():
+    global client
+    if client is None:
+        client = OpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            base_url=config.openai_base_url,
+        )
+    return client
+
+def get_async_client():
+    # created on the first uncached prompt, so reruns answered from the cache need no API key
+    global async_client
+    if async_client is None:
+        async_client = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            base_url=config.openai_base_url,
+        )
+    return async_client
+
+def get_cache_path(kind, key):
+    # entries are named by a hash of their key: the language name for "urls", the page url for "html" and the
+    # model and prompt for "responses". only responses are content-addressed, a changed prompt is a new entry, while
+    # urls and html are kept until their file is deleted, even if the wikipedia page changes
+    return os.path.join(cache_folder, kind, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".txt")
+
+def read_cache(kind, key):
+    cache_path = get_cache_path(kind, key)
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as file:
+            return file.read()
+    return None
+
+def write_cache(kind, key, content):
+    cache_path = get_cache_path(kind, key)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path + ".tmp", "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(cache_path + ".tmp", cache_path)
+
+def get_candidate_titles(language_name):
+    return [f"{language_name} alphabet", f"{language_name} orthography", f"{language_name} language", language_name]
+
+def read_cached_url(language_name):
+    url = read_cache("urls", language_name)
+    if url is not None:
+        print(f'found cached wikipedia url {url} for {language_name}')
+    return url
 
 def fetch_wikipedia_page(language_name):
+    url = read_cached_url(language_name)
+    if url is not None:
+        return url
+
     wiki = wikipediaapi.Wikipedia('python-bot')
     page = wiki.page(f"{language_name} alphabet")
     if page.exists():
@@ -32,37 +91,65 @@ def fetch_wikipedia_page(language_name):
                 if page.exists():
                     print(f'got wikipedia plain name page {page} for {language_name}')
     if page.exists():
+        write_cache("urls", language_name, page.fullurl)
         return page.fullurl
     return None
 
 def fetch_page_html(url):
+    html_content = read_cache("html", url)
+    if html_content is not None:
+        print(f'found cached html for {url}')
+        return html_content
+
     print(f'fetching url {url}')
     response = requests.get(url)
     if response.status_code == 200:
+        write_cache("html", url, response.text)
         return response.text
     return None
 
+def get_encoding():
+    global encoding
+    if encoding is None:
+        encoding = tiktoken.encoding_for_model("gpt-4o-mini")
+    return encoding
+
 def tokenize(text):
-    enc = tiktoken.encoding_for_model("gpt-4o-mini")
-    encoded = enc.encode(text)
-    return encoded
+    return get_encoding().encode(text)
 
 def get_tokens_length(text):
     return len(tokenize(text))
 
 def truncate_tokens(text, max_length):
+    # returns the text cut to at most max_length tokens, and its token count
     tokenized = tokenize(text)
-    while len(tokenized) > max_length:
-        text = text[:int(-(len(text) * 0.1))]
-        tokenized = tokenize(text)
-    return text
+    if len(tokenized) <= max_length:
+        return text, len(tokenized)
+    return get_encoding().decode(tokenized[:max_length]), max_length
+
+def strip_html(html_content):
+    # keeps the article body with its text and tables, dropping markup that only costs tokens
+    soup = BeautifulSoup(html_content, "html.parser")
+    content = soup.find("div", class_="mw-parser-output") or soup.body or soup
+    for element in content.find_all(["script", "style", "link", "meta", "noscript", "img", "figure"]):
+        element.decompose()
+    for element in content.select(".navbox, .reflist, .references, .mw-editsection, sup.reference, .metadata"):
+        element.decompose()
+    for element in content.find_all(["a", "span"]):
+        element.unwrap()
+    for element in content.find_all(True):
+        element.attrs = {key: value for key, value in element.attrs.items() if key in ("colspan", "rowspan")}
+    return str(content)
+
+def build_prompt(language_name, language_code, html_content):
+    if config.alphabet_strip_html:
+        print(f'stripping html for {language_name} ({language_code})')
+        html_content = strip_html(html_content)
 
-def extract_alphabet_letters(language_name, language_code, html_content):
     print(f'truncating html for {language_name} ({language_code})')
-    html_content = truncate_tokens(html_content, 124_000)
+    html_content, html_tokens_length = truncate_tokens(html_content, config.alphabet_max_tokens)
 
-    prompt = (
-        f"HTML:\n```{html_content}\n```"
+    instructions = (
         f"\n\nThis is the HTML content of a Wikipedia page about the {language_name} alphabet or orthography."
         "\nPlease extract and return a list of the letters used in this alphabet."
         "\nReturn only lowercase characters."
@@ -72,20 +159,34 @@ def extract_alphabet_letters(language_name, language_code, html_content):
         "\nDO NOT surround the JSON with triple grave accents (```)."
         "\nReturn ONLY the JSON. DO NOT write any messages along with the JSON."
     )
+    prompt = f"HTML:\n```{html_content}\n```" + instructions
 
-    print(f'prompting for {language_name} ({language_code}) with token length {get_tokens_length(prompt)}')
+    # the html is already tokenized, so only the wrapper around it is encoded (approximate where the pieces meet)
+    prompt_tokens_length = html_tokens_length + get_tokens_length("HTML:\n```\n```" + instructions)
+    print(f'prompting for {language_name} ({language_code}) with token length {prompt_tokens_length}')
+    return prompt
+
+def extract_alphabet_letters(language_name, language_code, html_content):
+    prompt = build_prompt(language_name, language_code, html_content)
+    cache_key = f"{alphabet_model}\n{prompt}"
+    letters = read_cache("responses", cache_key)
+    if letters is not None:
+        print(f'found cached response for {language_name} ({language_code})')
+        return letters
 
-    response = client.chat.completions.create(
+    response = get_client().chat.completions.create(
         messages=[
             {
                 "role": "user",
                 "content": prompt,
             }
         ],
-        model="gpt-4o",
+        model=alphabet_model,
     )
     print(response)
-    return response.choices[0].message.content.strip()
+    letters = response.choices[0].message.content.strip()
+    write_cache("responses", cache_key, letters)
+    return letters
 
 def write_results_to_file(language_code, results, filename):
     os.makedirs("letters", exist_ok=True)
@@ -101,7 +202,7 @@ def get_language_name(lang_code):
         return "Sorbian"
     if lang_code == "xal":
     	return "Kalmyk Oirat"
-    return Language.get(language_code).display_name()
+    return Language.get(lang_code).display_name()
 
 def main(language_code, filename):
     language_name = get_language_name(language_code)
@@ -121,10 +222,113 @@ def main(language_code, filename):
         return
     raise Exception(f'failed to run for {language}')
 
+async def fetch_wikipedia_page_async(http_client, language_name):
+    # resolves all candidate titles in one query instead of one existence check each
+    url = read_cached_url(language_name)
+    if url is not None:
+        return url
+
+    titles = get_candidate_titles(language_name)
+    response = await http_client.get(config.wikipedia_api_url, params={
+        "action": "query",
+        "titles": "|".join(titles),
+        "redirects": 1,
+        "prop": "info",
+        "inprop": "url",
+        "format": "json",
+    })
+    response.raise_for_status()
+    query = response.json().get("query", {})
+    renames = {item["from"]: item["to"] for item in query.get("normalized", []) + query.get("redirects", [])}
+    pages = {page["title"]: page for page in query.get("pages", {}).values() if "missing" not in page and "invalid" not in page}
+
+    for title in titles:
+        while title in renames and title not in pages:
+            title = renames[title]
+        if title in pages:
+            print(f'got wikipedia page {title} for {language_name}')
+            write_cache("urls", language_name, pages[title]["fullurl"])
+            return pages[title]["fullurl"]
+    return None
+
+async def fetch_page_html_async(http_client, url):
+    html_content = read_cache("html", url)
+    if html_content is not None:
+        print(f'found cached html for {url}')
+        return html_content
+
+    print(f'fetching url {url}')
+    response = await http_client.get(url)
+    if response.status_code == 200:
+        write_cache("html", url, response.text)
+        return response.text
+    return None
+
+async def extract_alphabet_letters_async(language_name, language_code, html_content):
+    prompt = await asyncio.to_thread(build_prompt, language_name, language_code, html_content)
+    cache_key = f"{alphabet_model}\n{prompt}"
+    letters = read_cache("responses", cache_key)
+    if letters is not None:
+        print(f'found cached response for {language_name} ({language_code})')
+        return letters
+
+    response = await get_async_client().chat.completions.create(
+        messages=[
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ],
+        model=alphabet_model,
+    )
+    print(response)
+    letters = response.choices[0].message.content.strip()
+    write_cache("responses", cache_key, letters)
+    return letters
+
+async def main_async_language(semaphore, http_client, language_code, filename):
+    async with semaphore:
+        language_name = get_language_name(language_code)
+        print(f"Processing {language_name} ({language_code})")
+        url = await fetch_wikipedia_page_async(http_client, language_name)
+        if not url:
+            print(f"No Wikipedia page found for {language_code} alphabet/orthography.")
+            return
+        html_content = await fetch_page_html_async(http_client, url)
+        if not html_content:
+            raise Exception(f"Failed to fetch HTML for {language_code}.")
+        letters = await extract_alphabet_letters_async(language_name, language_code, html_content)
+        print(f"\nAlphabet for {language_code}:\n{letters}\n")
+        write_results_to_file(language_code, letters, filename)
+
+async def main_async(language_files):
+    semaphore = asyncio.Semaphore(config.alphabet_concurrency)
+    async with httpx.AsyncClient(headers={"user-agent": "python-bot"}, follow_redirects=True, timeout=60) as http_client:
+        results = await asyncio.gather(
+            *(main_async_language(semaphore, http_client, language_code, filename) for language_code, filename in language_files),
+            return_exceptions=True,
+        )
+    failed = [(language_code, result) for (language_code, _), result in zip(language_files, results) if isinstance(result, Exception)]
+    for language_code, error in failed:
+        print(f"failed to run for {language_code}: {error}")
+    if failed:
+        raise Exception(f'failed to run for {", ".join(language_code for language_code, _ in failed)}')
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="extract language alphabets from Wikipedia with ChatGPT")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="process languages concurrently (up to config.alphabet_concurrency at a time)")
+    args = parser.parse_args()
+
+    language_files = []
     for language_code in config.languages:
         filename = f"letters/{language_code}-letters.txt"
         if os.path.exists(filename):
             print(f"File {filename} already exists. Skipping {language_code}...")
             continue
-        main(language_code, filename)
+        language_files.append((language_code, filename))
+
+    if args.use_async:
+        asyncio.run(main_async(language_files))
+    else:
+        for language_code, filename in language_files:
+            main(language_code, filename)
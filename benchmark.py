@@ -0,0 +1,543 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import unicodedata
+from collections import defaultdict
+from datetime import datetime, timezone
+import numpy as np
+import config
+import counting
+import frequency_matrix
+import scoring
+import sentence_store
+
+
+def legacy_count_letters(sentences_file, max_lines):
+    # the per-character loop that build_letter_frequency used before counting.py
+    counts = defaultdict(int)
+    with open(sentences_file, "r", encoding="utf-8") as file:
+        for at, line in enumerate(file):
+            if at >= max_lines:
+                break
+            for letter in ''.join(ch for ch in line if not unicodedata.category(ch).startswith('Cf')):
+                if len(letter) == 1 and letter.isalpha() and ord(letter) <= 0x024F:
+                    counts[letter] += 1
+    return dict(counts)
+
+
+def bench_counting(languages):
+    max_lines = config.use_sentences_count
+    multigraphs = counting.read_multigraphs()
+    legacy_total = 0
+    engine_total = 0
+    multigraph_total = 0
+    for language in languages:
+        sentences_file = os.path.join("corpora_files_extracted", f"{language}_sentences.txt")
+        if not os.path.exists(sentences_file):
+            print(f'skipping {language}, no sentences file')
+            continue
+
+        start = time.perf_counter()
+        legacy_counts = legacy_count_letters(sentences_file, max_lines)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        engine_counts = counting.counts_to_dict(counting.count_letters(sentences_file, max_lines))
+        engine_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        multigraph_counts = counting.count_letters(sentences_file, max_lines, multigraphs=multigraphs)
+        multigraph_time = time.perf_counter() - start
+
+        if legacy_counts != engine_counts:
+            raise Exception(f'counts differ for {language}')
+        if legacy_counts != counting.counts_to_dict(multigraph_counts[:counting.letter_count]):
+            raise Exception(f'letter counts with multigraphs differ for {language}')
+
+        legacy_total += legacy_time
+        engine_total += engine_time
+        multigraph_total += multigraph_time
+        print(f'{language}: legacy {legacy_time:.3f}s, engine {engine_time:.3f}s ({legacy_time / engine_time:.1f}x), with {len(multigraphs)} multigraphs {multigraph_time:.3f}s')
+
+    if engine_total > 0:
+        print(f'total: legacy {legacy_total:.3f}s, engine {engine_total:.3f}s ({legacy_total / engine_total:.1f}x), with {len(multigraphs)} multigraphs {multigraph_total:.3f}s ({multigraph_total / engine_total:.1f}x engine)')
+
+
+def legacy_rank_letters(letters, languages, lang_letter_frequencies, language_speakers, assumed_text_length, extra_language_deweight):
+    # the full-rescore selection loop that main.py used before scoring.py
+    def get_languages_with_letter(letter):
+        return [lang for lang in languages if letter in lang_letter_frequencies[lang]]
+
+    def get_letter_speakers(letter):
+        return sum(language_speakers[lang] for lang in get_languages_with_letter(letter))
+
+    lang_mults = {lang: 1 for lang in languages}
+
+    def get_letter_score(letter, deweighted):
+        total_freq_weighted = 0
+        for lang in get_languages_with_letter(letter):
+            total_freq_weighted += lang_letter_frequencies[lang][letter] * (language_speakers[lang] / get_letter_speakers(letter)) * (lang_mults[lang] if deweighted else 1)
+        return get_letter_speakers(letter) * total_freq_weighted * ((extra_language_deweight if deweighted else 1) ** (len(get_languages_with_letter(letter)) - 1)) / 1000
+
+    letters_list = {letter: 0 for letter in letters}
+    scored_letters = {}
+    while len(letters_list) > 0:
+        for letter in letters_list:
+            letters_list[letter] = get_letter_score(letter, True)
+        chosen = sorted(letters_list.items(), key=lambda x: x[1], reverse=True)[0][0]
+        scored_letters[chosen] = get_letter_score(chosen, False)
+        del letters_list[chosen]
+        for lang in get_languages_with_letter(chosen):
+            lang_mults[lang] *= 1 - scoring.get_letter_chance(lang_letter_frequencies[lang][chosen], assumed_text_length)
+    return scored_letters
+
+
+def make_synthetic_tables(language_count, letter_count, seed=0):
+    rnd = random.Random(seed)
+    languages = [f"l{at:03d}" for at in range(language_count)]
+    letters = [chr(0x0100 + at) for at in range(letter_count)]
+    lang_letter_frequencies = {lang: {} for lang in languages}
+    for letter in letters:
+        for lang in rnd.sample(languages, rnd.randint(1, min(config.max_languages, language_count))):
+            lang_letter_frequencies[lang][letter] = rnd.random() ** 4 / 10
+    language_speakers = {lang: rnd.randint(100_000, 100_000_000) for lang in languages}
+    return letters, languages, lang_letter_frequencies, language_speakers
+
+
+def make_synthetic_matrix(letters, languages, lang_letter_frequencies, language_speakers):
+    frequencies = np.array([[lang_letter_frequencies[lang].get(letter, 0.0) for letter in letters] for lang in languages])
+    return {
+        "languages": np.array(languages, dtype=str),
+        "letters": np.array(letters, dtype=str),
+        "speakers": np.array([language_speakers[lang] for lang in languages], dtype=np.int64),
+        "counts": (frequencies > 0).astype(np.int64),
+        "frequencies": frequencies,
+        "alphabet": frequencies > 0,
+        "total_frequencies": frequencies.mean(axis=0),
+    }
+
+
+def bench_scoring(scales):
+    for language_count, letter_count in scales:
+        tables = make_synthetic_tables(language_count, letter_count)
+        params = (config.assumed_text_length, config.extra_language_deweight)
+
+        start = time.perf_counter()
+        legacy_ranking = legacy_rank_letters(*tables, *params)
+        legacy_time = time.perf_counter() - start
+
+        matrix = make_synthetic_matrix(*tables)
+        start = time.perf_counter()
+        ranking = scoring.rank_letters(matrix, list(range(letter_count)), *params)
+        engine_time = time.perf_counter() - start
+
+        if list(legacy_ranking.items()) != list(ranking.items()):
+            raise Exception(f'rankings differ for {language_count} languages, {letter_count} letters')
+
+        print(f'{language_count} languages, {letter_count} letters: legacy {legacy_time:.3f}s, engine {engine_time:.3f}s ({legacy_time / engine_time:.1f}x)')
+
+
+def legacy_truncate_tokens(text, max_length):
+    # the truncation alphabet.py used before: reload the encoder and re-encode after every 10% trim
+    import tiktoken
+
+    def tokenize(text):
+        return tiktoken.encoding_for_model("gpt-4o-mini").encode(text)
+
+    tokenized = tokenize(text)
+    while len(tokenized) > max_length:
+        text = text[:int(-(len(text) * 0.1))]
+        tokenized = tokenize(text)
+    return text
+
+
+def bench_truncation(languages):
+    # needs the modules from requirements_alphabet.txt and network access to Wikipedia
+    import alphabet
+
+    totals = defaultdict(float)
+    for language_code in languages:
+        language_name = alphabet.get_language_name(language_code)
+        url = alphabet.fetch_wikipedia_page(language_name)
+        html_content = alphabet.fetch_page_html(url) if url else None
+        if not html_content:
+            print(f'skipping {language_code}, no wikipedia page')
+            continue
+
+        start = time.perf_counter()
+        legacy_text = legacy_truncate_tokens(html_content, config.alphabet_max_tokens)
+        legacy_tokens = alphabet.get_tokens_length(legacy_text)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, tokens = alphabet.truncate_tokens(html_content, config.alphabet_max_tokens)
+        engine_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, stripped_tokens = alphabet.truncate_tokens(alphabet.strip_html(html_content), config.alphabet_max_tokens)
+        stripped_time = time.perf_counter() - start
+
+        totals["legacy_time"] += legacy_time
+        totals["engine_time"] += engine_time
+        totals["stripped_time"] += stripped_time
+        totals["legacy_tokens"] += legacy_tokens
+        totals["tokens"] += tokens
+        totals["stripped_tokens"] += stripped_tokens
+        print(f'{language_code}: legacy {legacy_time:.3f}s {legacy_tokens} tokens, engine {engine_time:.3f}s {tokens} tokens, stripped {stripped_time:.3f}s {stripped_tokens} tokens')
+
+    if totals["engine_time"] > 0:
+        print(f'total: legacy {totals["legacy_time"]:.3f}s {totals["legacy_tokens"]:.0f} tokens, engine {totals["engine_time"]:.3f}s {totals["tokens"]:.0f} tokens, stripped {totals["stripped_time"]:.3f}s {totals["stripped_tokens"]:.0f} tokens')
+
+
+def bench_classifier(languages, held_out):
+    # tables are built from each cached sentences file except its last held_out lines, which are then classified
+    import classifier
+    import frequency_matrix
+    import speaker_counts
+
+    lang_counts = []
+    texts = []
+    expected = []
+    for language in languages:
+        sentences_file = os.path.join("corpora_files_extracted", f"{language}_sentences.txt")
+        with open(sentences_file, "r", encoding="utf-8") as file:
+            lines = file.read().split("\n")
+        if len(lines) <= held_out:
+            raise Exception(f'{sentences_file} has only {len(lines)} sentences, need more than {held_out}')
+        lang_counts.append(counting.count_letters(sentences_file, len(lines) - held_out))
+        texts += lines[-held_out:]
+        expected += [len(lang_counts) - 1] * held_out
+
+    speakers = speaker_counts.load_language_speakers(languages)
+    matrix = frequency_matrix.build_frequency_matrix(languages, lang_counts, [[] for _ in languages], [speakers[lang] for lang in languages], counting.get_units(()))
+    model = classifier.build_classifier(matrix)
+
+    start = time.perf_counter()
+    ranked, _ = classifier.rank_texts(model, texts, 1)
+    rank_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    classifier.classify(model, texts, 1)
+    classify_time = time.perf_counter() - start
+
+    correct = ranked[:, 0] == np.array(expected)
+    for at, language in enumerate(languages):
+        print(f'{language}: {correct[at * held_out:(at + 1) * held_out].mean():.1%} correct')
+    print(f'{len(texts)} texts: {correct.mean():.1%} correct, rank_texts {len(texts) / rank_time:,.0f} texts/s, classify {len(texts) / classify_time:,.0f} texts/s')
+
+
+def bench_store(languages, random_sentences):
+    # the text sentences files against their sentence stores, both read from the page cache
+    import scripts
+
+    use_sentence_store = config.use_sentence_store
+    totals = defaultdict(float)
+    rng = np.random.default_rng(0)
+    try:
+        for language in languages:
+            sentences_file = os.path.join("corpora_files_extracted", f"{language}_sentences.txt")
+            if not os.path.exists(sentences_file):
+                raise Exception(f'missing sentences for {language}')
+            times = {}
+
+            start = time.perf_counter()
+            sentence_store.build_store(sentences_file)
+            times["convert"] = time.perf_counter() - start
+
+            config.use_sentence_store = False
+            start = time.perf_counter()
+            with open(sentences_file, "r", encoding="utf-8") as file:
+                lines = file.read().split("\n")
+            times["text_load"] = time.perf_counter() - start
+            start = time.perf_counter()
+            scripts.profile_sentences_file(sentences_file)
+            times["text_script"] = time.perf_counter() - start
+            start = time.perf_counter()
+            text_counts = counting.count_letters(sentences_file, config.use_sentences_count)
+            times["text_count"] = time.perf_counter() - start
+
+            config.use_sentence_store = True
+            start = time.perf_counter()
+            store = sentence_store.open_store(sentences_file)
+            times["store_load"] = time.perf_counter() - start
+            start = time.perf_counter()
+            scripts.profile_sentences_file(sentences_file)
+            times["store_script"] = time.perf_counter() - start
+            start = time.perf_counter()
+            store_counts = counting.count_letters(sentences_file, config.use_sentences_count)
+            times["store_count"] = time.perf_counter() - start
+
+            indices = rng.integers(0, store["sentences"], random_sentences).tolist()
+            start = time.perf_counter()
+            sentences = [sentence_store.get_sentence(store, index) for index in indices]
+            times["store_random"] = time.perf_counter() - start
+            expected = [lines[index] for index in indices]
+            if store["normalization"]:
+                expected = [unicodedata.normalize(store["normalization"], sentence) for sentence in expected]
+            if sentences != expected or not np.array_equal(text_counts, store_counts):
+                raise Exception(f'sentence store of {language} does not match its sentences file')
+
+            text_bytes = os.path.getsize(sentences_file)
+            store_bytes = sum(os.path.getsize(path) for path in sentence_store.get_store_paths(sentences_file))
+            for name, seconds in times.items():
+                totals[name] += seconds
+            totals["text_bytes"] += text_bytes
+            totals["store_bytes"] += store_bytes
+            print(f'{language}: {store["dtype"]}, text {text_bytes / 1e6:.1f} MB, store {store_bytes / 1e6:.1f} MB, converted in {times["convert"]:.3f}s; '
+                  f'load text {times["text_load"]:.4f}s / store {times["store_load"]:.4f}s, script profile {times["text_script"]:.4f}s / {times["store_script"]:.4f}s, '
+                  f'count {times["text_count"]:.3f}s / {times["store_count"]:.3f}s, {random_sentences} random sentences {times["store_random"]:.4f}s')
+    finally:
+        config.use_sentence_store = use_sentence_store
+
+    if totals["text_count"] > 0:
+        print(f'total: text {totals["text_bytes"] / 1e6:.1f} MB, store {totals["store_bytes"] / 1e6:.1f} MB, converted in {totals["convert"]:.2f}s')
+        print(f'  load: text {totals["text_load"]:.3f}s, store {totals["store_load"]:.3f}s')
+        print(f'  script profile: text {totals["text_script"]:.3f}s, store {totals["store_script"]:.3f}s')
+        print(f'  counting: text {totals["text_count"]:.3f}s, store {totals["store_count"]:.3f}s ({totals["text_count"] / totals["store_count"]:.2f}x)')
+        print(f'  random sentences: {len(languages) * random_sentences / totals["store_random"]:,.0f} sentences/s from the stores')
+
+
+def legacy_latin_share(sentences_file):
+    # the check_language_script before scripts.py: the first 1000 lines, with spaces and digits counted as Latin
+    with open(sentences_file, "r", encoding="utf-8") as file:
+        text = " ".join(file.readlines()[:1000])
+    latin_count = sum(1 for char in text if ord(char) <= 0x024F)
+    return latin_count / len(text) if text else 0.0
+
+
+def bench_scripts(languages):
+    # script profiling of the cached sentences files, and filtering all their sentences, against plain reading
+    import scripts
+
+    use_sentence_store = config.use_sentence_store
+    totals = defaultdict(float)
+    try:
+        for language in languages:
+            sentences_file = os.path.join("corpora_files_extracted", f"{language}_sentences.txt")
+            if not os.path.exists(sentences_file):
+                raise Exception(f'missing sentences for {language}')
+            times = {}
+
+            start = time.perf_counter()
+            with open(sentences_file, "r", encoding="utf-8") as file:
+                lines = file.read().split("\n")
+            times["read"] = time.perf_counter() - start
+            start = time.perf_counter()
+            legacy_share = legacy_latin_share(sentences_file)
+            times["legacy"] = time.perf_counter() - start
+            config.use_sentence_store = False
+            start = time.perf_counter()
+            script_counts = scripts.profile_sentences_file(sentences_file)
+            times["profile"] = time.perf_counter() - start
+            start = time.perf_counter()
+            kept = scripts.filter_latin_sentences(lines)
+            times["filter"] = time.perf_counter() - start
+
+            for name, seconds in times.items():
+                totals[name] += seconds
+            totals["sentences"] += len(lines)
+            totals["kept"] += len(kept)
+            shares = ", ".join(f'{script} {share:.2%}' for script, share in scripts.get_script_shares(script_counts).items())
+            print(f'{language}: read {times["read"]:.4f}s, legacy check {times["legacy"]:.4f}s ({legacy_share:.1%} latin characters), '
+                  f'profile {times["profile"]:.4f}s ({shares}), filter {times["filter"]:.4f}s keeping {len(kept)} of {len(lines)}')
+    finally:
+        config.use_sentence_store = use_sentence_store
+
+    if totals["read"] > 0:
+        print(f'total: read {totals["read"]:.3f}s, legacy check {totals["legacy"]:.3f}s, profile {totals["profile"]:.3f}s')
+        print(f'  filter: {totals["filter"]:.3f}s, {totals["sentences"] / totals["filter"]:,.0f} sentences/s, kept {totals["kept"]:.0f} of {totals["sentences"]:.0f}')
+
+
+# lowercase Latin letters the synthetic alphabets are drawn from, the basic ones first
+synthetic_latin_letters = [chr(code_point) for code_point in range(ord("a"), ord("z") + 1)] + [
+    chr(code_point) for code_point in range(0x00DF, counting.latin_end) if chr(code_point).isalpha() and chr(code_point).islower()
+]
+synthetic_foreign_letters = [chr(code_point) for code_point in range(0x0430, 0x0450)] + [chr(code_point) for code_point in range(0x03B1, 0x03CA)] + [chr(code_point) for code_point in range(0x4E00, 0x4E40)]
+synthetic_format_chars = ["\u00ad", "\u200b", "\u200c", "\u200d", "\u2060", "\ufeff"]
+pipeline_results_file = "benchmark_results.jsonl"
+
+
+def get_synthetic_languages(language_count):
+    # qaa-qtz is the ISO 639-3 range reserved for local use, so these never clash with real languages
+    codes = [f"q{first}{second}" for first in "abcdefghijklmnopqrst" for second in "abcdefghijklmnopqrstuvwxyz"]
+    if language_count > len(codes):
+        raise Exception(f'at most {len(codes)} synthetic languages are supported')
+    return codes[:language_count]
+
+
+def make_synthetic_sentences(rng, alphabet, sentence_count, foreign_share, format_share):
+    # letters follow a Zipf-like distribution, so later alphabet letters are rare like diacritics in real text
+    letter_weights = 1 / np.arange(1, len(alphabet) + 1)
+    letter_weights = letter_weights / letter_weights.sum() * (0.84 - foreign_share - format_share)
+    symbols = [" "] + alphabet + synthetic_foreign_letters + synthetic_format_chars
+    weights = np.concatenate((
+        [0.16],
+        letter_weights,
+        np.full(len(synthetic_foreign_letters), foreign_share / len(synthetic_foreign_letters)),
+        np.full(len(synthetic_format_chars), format_share / len(synthetic_format_chars)),
+    ))
+
+    sentence_lengths = rng.integers(20, 160, sentence_count)
+    code_points = np.array([ord(symbol) for symbol in symbols], dtype=np.uint32)[rng.choice(len(symbols), int(sentence_lengths.sum()), p=weights)]
+    code_points[np.cumsum(sentence_lengths) - 1] = ord("\n")
+    return code_points.astype("<u4").tobytes().decode("utf-32-le")
+
+
+def make_synthetic_corpus(folder, sentence_count, language_count, alphabet_size, foreign_share, format_share, seed=0):
+    # writes the sentences, letters and speakers files the count stage reads, for sentence_count sentences split over the languages
+    rng = np.random.default_rng(seed)
+    languages = get_synthetic_languages(language_count)
+    for subfolder in ("corpora_files_extracted", "letters", "speakers"):
+        os.makedirs(os.path.join(folder, subfolder), exist_ok=True)
+
+    for language in languages:
+        alphabet = synthetic_latin_letters[:alphabet_size // 2] + rng.choice(synthetic_latin_letters[alphabet_size // 2:], alphabet_size - alphabet_size // 2, replace=False).tolist()
+        sentences = make_synthetic_sentences(rng, alphabet, max(sentence_count // language_count, 1), foreign_share, format_share)
+        with open(os.path.join(folder, "corpora_files_extracted", f"{language}_sentences.txt"), "w", encoding="utf-8") as file:
+            file.write(sentences)
+        with open(os.path.join(folder, "letters", f"{language}-letters.txt"), "w", encoding="utf-8") as file:
+            json.dump({"letters": alphabet}, file, ensure_ascii=False, indent=2)
+        with open(os.path.join(folder, "speakers", f"{language}.txt"), "w", encoding="utf-8") as file:
+            file.write(str(int(rng.integers(100_000, 100_000_000))))
+    return languages
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_pipeline_results(results_file):
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def time_pipeline(languages):
+    # runs in the synthetic corpus folder, stage output goes to devnull so only the timings are printed
+    import main
+
+    timings = {}
+    # the code point conversion and counting that build_letter_frequency runs on every sentences file, without
+    # the caching and file handling around it
+    start = time.perf_counter()
+    for language in languages:
+        with open(os.path.join("corpora_files_extracted", f"{language}_sentences.txt"), "r", encoding="utf-8") as file:
+            counting.count_code_points(counting.get_code_points(file.read()), np.zeros(counting.letter_count, dtype=np.int64))
+    timings["count_code_points"] = time.perf_counter() - start
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        matrix = main.build_letter_frequency(languages)
+        timings["build_letter_frequency"] = time.perf_counter() - start
+
+        all_letters = main.get_all_letters(matrix)
+        # every letter is ranked, with max_languages most letters of a few hundred languages would be filtered out
+        candidates = main.get_candidates(matrix, all_letters, len(languages))
+        start = time.perf_counter()
+        scored_letters = scoring.rank_letters(matrix, candidates, config.assumed_text_length, config.extra_language_deweight)
+        timings["rank_letters"] = time.perf_counter() - start
+
+        frequency_matrix.save_frequency_matrix(matrix, main.letter_frequencies_file)
+        with open(main.scored_letters_file, "w", encoding="utf-8") as file:
+            json.dump({"all_letters": all_letters, "scored_letters": list(scored_letters.items())}, file, ensure_ascii=False)
+        start = time.perf_counter()
+        main.export_results()
+        timings["export_results"] = time.perf_counter() - start
+    return timings
+
+
+def bench_pipeline(sentence_counts, language_counts, alphabet_size, foreign_share, format_share, results_file):
+    previous_results = read_pipeline_results(results_file)
+    commit = get_commit()
+    use_sentences_count = config.use_sentences_count
+    cwd = os.getcwd()
+    for sentence_count in sentence_counts:
+        for language_count in language_counts:
+            folder = tempfile.mkdtemp(prefix="benchmark_corpus_")
+            try:
+                start = time.perf_counter()
+                languages = make_synthetic_corpus(folder, sentence_count, language_count, alphabet_size, foreign_share, format_share)
+                print(f'{sentence_count} sentences, {language_count} languages: generated in {time.perf_counter() - start:.1f}s')
+
+                # count every generated sentence, and never reuse counts from an earlier scale
+                config.use_sentences_count = max(sentence_count // language_count, 1)
+                os.chdir(folder)
+                timings = time_pipeline(languages)
+            finally:
+                os.chdir(cwd)
+                config.use_sentences_count = use_sentences_count
+                shutil.rmtree(folder, ignore_errors=True)
+
+            result = {
+                "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "commit": commit,
+                "sentences": sentence_count,
+                "languages": language_count,
+                "alphabet_size": alphabet_size,
+                "foreign_share": foreign_share,
+                "format_share": format_share,
+                "timings": {stage: round(seconds, 4) for stage, seconds in timings.items()},
+            }
+            with open(results_file, "a", encoding="utf-8") as file:
+                file.write(json.dumps(result) + "\n")
+
+            # compare with the last recorded run of the same scale
+            params = ("sentences", "languages", "alphabet_size", "foreign_share", "format_share")
+            previous = next((previous for previous in reversed(previous_results) if all(previous[param] == result[param] for param in params)), None)
+            for stage, seconds in timings.items():
+                change = ""
+                if previous and previous["timings"].get(stage):
+                    change = f' ({seconds / previous["timings"][stage] - 1:+.0%} vs {previous["commit"] or previous["time"]})'
+                print(f'  {stage}: {seconds:.3f}s{change}')
+    print(f'saved results to: {results_file}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark pipeline stages against their original implementations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    counting_parser = subparsers.add_parser("counting", help="letter counting on the cached sentences files")
+    counting_parser.add_argument("languages", nargs="*", default=config.languages)
+    subparsers.add_parser("scoring", help="greedy letter selection on synthetic tables")
+    truncation_parser = subparsers.add_parser("truncation", help="alphabet.py html truncation on the wikipedia pages")
+    truncation_parser.add_argument("languages", nargs="*", default=config.languages)
+    classifier_parser = subparsers.add_parser("classifier", help="classifier.py accuracy and throughput on held-out cached sentences")
+    classifier_parser.add_argument("languages", nargs="*", default=config.languages)
+    classifier_parser.add_argument("--held-out", type=int, default=1_000, help="sentences per language left out of the tables and classified")
+    store_parser = subparsers.add_parser("store", help="sentence stores against the text sentences files they are built from")
+    store_parser.add_argument("languages", nargs="*", default=config.languages)
+    store_parser.add_argument("--random-sentences", type=int, default=10_000, help="sentences read at random positions from each store")
+    scripts_parser = subparsers.add_parser("scripts", help="script profiling and sentence filtering on the cached sentences files")
+    scripts_parser.add_argument("languages", nargs="*", default=config.languages)
+    pipeline_parser = subparsers.add_parser("pipeline", help="main.py stages on generated corpora of increasing size, offline")
+    pipeline_parser.add_argument("--sentences", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000], help="total sentences, split evenly over the languages")
+    pipeline_parser.add_argument("--languages", type=int, nargs="+", default=[40, 400])
+    pipeline_parser.add_argument("--alphabet-size", type=int, default=32, help="letters per language")
+    pipeline_parser.add_argument("--foreign-share", type=float, default=0.02, help="share of non-Latin characters")
+    pipeline_parser.add_argument("--format-share", type=float, default=0.002, help="share of Cf format characters")
+    pipeline_parser.add_argument("--output", default=pipeline_results_file)
+    args = parser.parse_args()
+
+    if args.command == "counting":
+        bench_counting(args.languages)
+    elif args.command == "scoring":
+        bench_scoring([(40, 100), (100, 250), (200, 500), (400, 1000)])
+    elif args.command == "truncation":
+        bench_truncation(args.languages)
+    elif args.command == "classifier":
+        bench_classifier(args.languages, args.held_out)
+    elif args.command == "store":
+        bench_store(args.languages, args.random_sentences)
+    elif args.command == "scripts":
+        bench_scripts(args.languages)
+    elif args.command == "pipeline":
+        bench_pipeline(args.sentences, args.languages, args.alphabet_size, args.foreign_share, args.format_share, os.path.abspath(args.output))
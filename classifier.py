@@ -0,0 +1,104 @@
+import argparse
+import sys
+from itertools import islice
+import numpy as np
+import frequency_matrix
+
+# guesses the language of texts from their letters, using the per-language letter counts saved by `main.py count`
+
+letter_frequencies_file = "letter_frequencies.npz"
+# added to every letter count, so a letter never seen in a language's corpus does not rule the language out
+smoothing = 0.5
+# texts scored at once, bounds the texts x letters count table to a few tens of megabytes
+batch_size = 10_000
+
+
+def build_classifier(matrix):
+    single_letters = np.array([len(letter) == 1 for letter in matrix["letters"].tolist()], dtype=bool)
+    letters = matrix["letters"][single_letters]
+    counts = matrix["counts"][:, single_letters] + smoothing
+    speakers = matrix["speakers"].astype(np.float64)
+
+    # letters x languages log probabilities, plus a zero row that every other character maps to
+    log_probabilities = np.log(counts / counts.sum(axis=1, keepdims=True)).T
+    code_points = [ord(letter) for letter in letters.tolist()]
+    columns = np.full(max(code_points, default=0) + 2, len(code_points), dtype=np.intp)
+    columns[code_points] = np.arange(len(code_points))
+
+    return {
+        "languages": matrix["languages"].tolist(),
+        "columns": columns,
+        "log_probabilities": np.vstack((log_probabilities, np.zeros(log_probabilities.shape[1]))),
+        # speakers as the prior, the same weighting the letter scores use
+        "log_priors": np.log(speakers / speakers.sum()),
+    }
+
+
+def load_classifier(file_path=letter_frequencies_file):
+    return build_classifier(frequency_matrix.load_frequency_matrix(file_path))
+
+
+def count_texts(classifier, texts):
+    # texts x letters counts from one pass over all texts joined together
+    texts = [text.lower() for text in texts]
+    lengths = np.fromiter(map(len, texts), dtype=np.intp, count=len(texts))
+    code_points = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    columns = classifier["columns"][np.minimum(code_points, len(classifier["columns"]) - 1)]
+    column_count = len(classifier["log_probabilities"])
+    cells = np.repeat(np.arange(len(texts)) * column_count, lengths) + columns
+    return np.bincount(cells, minlength=len(texts) * column_count).reshape(len(texts), column_count)
+
+
+def score_texts(classifier, texts):
+    # log posterior of each language for each text, up to a per-text constant
+    scores = []
+    for start in range(0, len(texts), batch_size):
+        counts = count_texts(classifier, texts[start:start + batch_size])
+        scores.append(counts @ classifier["log_probabilities"] + classifier["log_priors"])
+    if not scores:
+        return np.zeros((0, len(classifier["languages"])))
+    return np.vstack(scores)
+
+
+def rank_texts(classifier, texts, top=3):
+    # each text's `top` most likely language indices and their probabilities as arrays, best first
+    scores = score_texts(classifier, texts)
+    top = min(top, scores.shape[1])
+    candidates = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    ranked = np.take_along_axis(candidates, order, axis=1)
+
+    best = candidate_scores.max(axis=1, keepdims=True)
+    log_totals = best + np.log(np.exp(scores - best).sum(axis=1, keepdims=True))
+    return ranked, np.exp(np.take_along_axis(candidate_scores, order, axis=1) - log_totals)
+
+
+def classify(classifier, texts, top=3):
+    # returns each text's `top` most likely languages with their probabilities, best first
+    ranked, probabilities = rank_texts(classifier, list(texts), top)
+    languages = classifier["languages"]
+    return [
+        [(languages[lang], probability) for lang, probability in zip(text_ranked, text_probabilities)]
+        for text_ranked, text_probabilities in zip(ranked.tolist(), probabilities.tolist())
+    ]
+
+
+def classify_stream(classifier, input_file, output_file, top, lines_per_batch):
+    # one tab separated line per input line: language and probability pairs, best first
+    while lines := list(islice(input_file, lines_per_batch)):
+        results = classify(classifier, [line.rstrip("\n") for line in lines], top)
+        output_file.write("".join("\t".join(f"{lang}\t{probability:.4f}" for lang, probability in candidates) + "\n" for candidates in results))
+        output_file.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="guess the language of each line read from stdin")
+    parser.add_argument("--top", type=int, default=3, help="number of candidate languages printed per line")
+    parser.add_argument("--batch-size", type=int, default=batch_size, help="lines read and classified at once")
+    parser.add_argument("--file", default=letter_frequencies_file, help="letter counts saved by the count stage")
+    args = parser.parse_args()
+
+    sys.stdin.reconfigure(encoding="utf-8")
+    sys.stdout.reconfigure(encoding="utf-8")
+    classify_stream(load_classifier(args.file), sys.stdin, sys.stdout, args.top, args.batch_size)
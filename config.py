@@ -3,16 +3,55 @@
 corpus_types = ["wikipedia"]#, "news", "newscrawl", "web"]
 corpus_years = range(2024, 2000, -1)  # from 2024 to 2001
 corpus_sizes = ["100K", "10K"]
+corpus_base_url = "https://downloads.wortschatz-leipzig.de/corpora/"
+download_host_connections = 8  # concurrent requests per host when probing and downloading corpora, shared by the `workers` processes
+download_retries = 3
+script_sample_sentences = 1000  # sentences sampled across each cached corpus to profile its scripts
+min_latin_share = 0.9  # share of the sampled letters (not spaces, digits or punctuation) that must be Latin for a language to be analysed
+drop_non_latin_sentences = False  # leave out sentences whose letters are mostly in other scripts when caching a corpus
+sentence_min_latin_share = 0.5  # share of a sentence's letters that must be Latin to keep it with drop_non_latin_sentences
 
 # analysis
 
 use_sentences_count = 100_000
+full_latin_range = False  # count every Latin letter, including Latin Extended Additional and Extended-C to G, composing decomposed diacritics first (default stops at U+024F)
+derived_alphabet_min_frequency = 0.0005  # with all_available_languages, languages without a letters file use their corpus letters at least this frequent
+count_multigraphs = False  # also count and rank the multi-letter units in the letters files, e.g. "ch" or "sz"
+extra_multigraphs = []  # multi-letter units to count in addition to those in the letters files (up to 3 characters)
 max_languages = 4
 assumed_text_length = 40
 extra_language_deweight = 1
+sampling_tolerance = None  # stop counting a language once letter frequencies are within this relative error, e.g. 0.05 (None counts all use_sentences_count sentences)
+sampling_min_frequency = 0.0  # letters rarer than this only need the error allowed at this frequency (0 holds every alphabet letter to sampling_tolerance)
+sampling_confidence = 1.96  # z-score of the confidence intervals, 1.96 is 95%
+evaluation_sentences_count = 0  # sentences picked at random from each sentences file and left out of counting for `main.py evaluate`, e.g. 2_000
+evaluation_seed = 0  # seed of the random pick of held-out sentences
+
+# performance
+
+workers = 1  # processes for per-language download, extraction and counting (1 runs serially)
+profile_counting = False  # write a cProfile of each language's letter counting to the profiles folder
+use_sentence_store = False  # keep a memory-mapped code point copy of each sentences file, which counting, script checks and evaluation read instead of the text (about twice the size of the text)
+
+# sources
+
+wikidata_sparql_url = "https://query.wikidata.org/sparql"
+available_languages_ttl = 7 * 24 * 60 * 60  # seconds before the cached Wortschatz language list is refetched
+
+# alphabets
+
+alphabet_max_tokens = 124_000  # token budget for the wikipedia html sent to the model
+alphabet_strip_html = False  # strip the html down to the article text and tables before truncating
+alphabet_concurrency = 8  # languages processed at once with `alphabet.py --async`
+wikipedia_api_url = "https://en.wikipedia.org/w/api.php"  # used by `alphabet.py --async`
+openai_base_url = None  # OpenAI-compatible endpoint, None for the default
 
 # general
 
+round_log_verbosity = 2  # score stage output for each selection round: 0 nothing, 1 the chosen letter and deweighting, 2 also every candidate's score
+trace_selection = True  # record the selection rounds to selection_trace.jsonl, `main.py trace` prints them again
+all_available_languages = False  # analyse every latin script language available on Wortschatz instead of `languages`
+
 languages = [
     "eng",
     "deu",
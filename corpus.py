@@ -0,0 +1,237 @@
+import io
+import os
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+import config
+import instrumentation
+import scripts
+import sentence_store
+
+download_timeout = 60
+
+session = None
+host_semaphores = {}
+host_semaphores_lock = threading.Lock()
+
+
+def get_host_connections():
+    # download_host_connections is shared by the worker processes, each gets its part
+    return max(config.download_host_connections // max(config.workers, 1), 1)
+
+
+def get_session():
+    # one pooled session per process, sized for the concurrent probes
+    global session
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=get_host_connections())
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["user-agent"] = "python-bot"
+    return session
+
+
+def get_host_semaphore(url):
+    host = urlparse(url).netloc
+    with host_semaphores_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.BoundedSemaphore(get_host_connections())
+        return host_semaphores[host]
+
+
+def get_candidate_urls(language):
+    # in order of preference: larger corpora first, then newer years
+    return [
+        f"{config.corpus_base_url}{language}_{corpus_type}_{year}_{size}.tar.gz"
+        for size in config.corpus_sizes
+        for year in config.corpus_years
+        for corpus_type in config.corpus_types
+    ]
+
+
+def probe_url(url):
+    with get_host_semaphore(url):
+        try:
+            response = get_session().head(url, allow_redirects=True, timeout=download_timeout)
+            instrumentation.add_counter("http_requests")
+            return response.status_code == 200
+        except requests.RequestException as e:
+            print(f"error probing {url}: {e}")
+            return False
+
+
+def find_corpus_url(language):
+    # probes in order of preference, one batch of concurrent requests at a time, and stops at the first batch with
+    # an available corpus
+    candidate_urls = get_candidate_urls(language)
+    batch_size = get_host_connections()
+    print(f"probing up to {len(candidate_urls)} corpus urls for {language}")
+    with ThreadPoolExecutor(max_workers=batch_size) as executor:
+        for start in range(0, len(candidate_urls), batch_size):
+            batch = candidate_urls[start:start + batch_size]
+            for url, is_available in zip(batch, executor.map(probe_url, batch)):
+                if is_available:
+                    return url
+    return None
+
+
+def download_file(url, temp_file_path):
+    # appends to an existing partial download with a Range request, returns True once complete
+    downloaded_size = os.path.getsize(temp_file_path) if os.path.exists(temp_file_path) else 0
+    headers = {"Range": f"bytes={downloaded_size}-"} if downloaded_size else {}
+
+    with get_host_semaphore(url):
+        with get_session().get(url, stream=True, headers=headers, timeout=download_timeout) as response:
+            instrumentation.add_counter("http_requests")
+            if response.status_code == 416:
+                # nothing left to fetch past our offset, the partial file is stale
+                os.remove(temp_file_path)
+                return False
+            if response.status_code == 206:
+                total_size = int(response.headers.get("Content-Range", "*/0").rsplit("/", 1)[1])
+                print(f"resuming download at {downloaded_size} bytes: {url}")
+                mode = "ab"
+            elif response.status_code == 200:
+                total_size = int(response.headers.get("Content-Length", 0))
+                downloaded_size = 0
+                mode = "wb"
+            else:
+                raise Exception(f"HTTP {response.status_code} downloading {url}")
+
+            with open(temp_file_path, mode) as file:
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    file.write(chunk)
+                    downloaded_size += len(chunk)
+                    instrumentation.add_counter("http_bytes", len(chunk))
+
+    return total_size == 0 or downloaded_size == total_size
+
+
+def attempt_download(language, file_path):
+    if os.path.exists(file_path):
+        print(f"found tar: {file_path}")
+        return file_path
+
+    download_url = find_corpus_url(language)
+    if not download_url:
+        print(f"no available corpus found for {language}.")
+        return None
+
+    # partial downloads are kept under the remote file name so a resume never mixes two corpora
+    temp_file_path = os.path.join(os.path.dirname(file_path), os.path.basename(download_url) + ".part")
+    for attempt in range(config.download_retries):
+        print(f"downloading: {download_url}")
+        try:
+            if download_file(download_url, temp_file_path):
+                os.replace(temp_file_path, file_path)
+                print(f"downloaded and saved: {file_path}")
+                return file_path
+            print(f"incomplete download: {download_url}")
+        except Exception as e:
+            print(f"error downloading {download_url}: {e}")
+
+    print(f"failed to download {download_url} after {config.download_retries} attempts.")
+    return None
+
+
+def extract_and_process_corpus(language, sentences_output_file):
+    if os.path.exists(sentences_output_file):
+        print(f'found sentences file: {sentences_output_file}')
+        return sentences_output_file
+
+    save_file_path = f"corpora_files/{language}.tar.gz"
+    downloaded_file = attempt_download(language, save_file_path)
+    if not downloaded_file:
+        raise Exception(f'failed to download file {downloaded_file}')
+
+    # stream only the `-sentences` member, writing to a temp file so an interrupted run leaves no partial cache
+    print(f"extracting sentences from: {save_file_path}")
+    temp_output_file = sentences_output_file + ".tmp"
+    sentences_count = 0
+    reservoir = scripts.new_reservoir(config.script_sample_sentences)
+    try:
+        with tarfile.open(save_file_path, "r:gz") as tar:
+            for member in tar:
+                if not member.isfile() or not member.name.endswith("-sentences.txt"):
+                    continue
+                print(f"reading sentences from: {member.name}")
+                with (
+                    io.TextIOWrapper(tar.extractfile(member), encoding="utf-8", errors="replace") as file,
+                    open(temp_output_file, "w", encoding="utf-8") as output_file,
+                ):
+                    block = []
+                    for line in file:
+                        parts = line.split("\t", maxsplit=1)
+                        if len(parts) > 1:
+                            block.append(parts[1].strip().lower())
+                            if len(block) >= min(scripts.block_lines, config.use_sentences_count - sentences_count):
+                                sentences_count += write_sentences(output_file, block, sentences_count, reservoir)
+                                block = []
+                                if sentences_count >= config.use_sentences_count:
+                                    break
+                    sentences_count += write_sentences(output_file, block, sentences_count, reservoir)
+                break
+            else:
+                print(f"no `-sentences` file found in {save_file_path}.")
+                return None
+    except Exception as e:
+        print(f"failed to read sentences from {save_file_path}: {e}")
+        if os.path.exists(temp_output_file):
+            os.remove(temp_output_file)
+        return None
+
+    os.replace(temp_output_file, sentences_output_file)
+    # profiled before filtering, so a corpus that is mostly in another script is still rejected
+    scripts.save_script_profile(sentences_output_file, scripts.count_scripts(scripts.get_code_points(reservoir["lines"])))
+    if config.drop_non_latin_sentences:
+        print(f'dropped {reservoir["seen"] - sentences_count} sentences that are not mostly latin')
+    print(f"saved {sentences_count} sentences to: {sentences_output_file}")
+    return sentences_output_file
+
+
+def write_sentences(output_file, sentences, written_count, reservoir):
+    # samples a block of sentences for the script profile and writes those that pass the script filter
+    scripts.add_to_reservoir(reservoir, sentences)
+    if config.drop_non_latin_sentences:
+        sentences = scripts.filter_latin_sentences(sentences)
+    if sentences:
+        output_file.write(("\n" if written_count > 0 else "") + "\n".join(sentences))
+    return len(sentences)
+
+
+def check_language_script(language, sentences_file):
+    if not os.path.exists(sentences_file):
+        raise Exception(f'sentences file not found to check language for {language}')
+
+    try:
+        script_counts = scripts.get_script_profile(sentences_file)
+    except Exception as e:
+        print(f"error reading file for {language}: {e}")
+        return False
+    shares = scripts.get_script_shares(script_counts)
+    instrumentation.set_metric("scripts", shares)
+    if scripts.get_latin_share(script_counts) < config.min_latin_share:
+        print(f'{language} letters by script: ' + ", ".join(f'{script} {share:.1%}' for script, share in shares.items()))
+        return False
+    return True
+
+
+def prepare_language(language):
+    sentences_output_file = os.path.join("corpora_files_extracted", f"{language}_sentences.txt")
+
+    try:
+        extract_and_process_corpus(language, sentences_output_file)
+        if config.use_sentence_store:
+            sentence_store.update_store(sentences_output_file)
+
+        if not check_language_script(language, sentences_output_file):
+            raise Exception(f'language {language} does not use latin script')
+    except Exception as e:
+        # with all_available_languages the count stage only uses languages whose latin sentences were fetched
+        if not config.all_available_languages:
+            raise
+        print(f"skipping {language}: {e}")
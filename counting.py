@@ -0,0 +1,432 @@
+import hashlib
+import json
+import math
+import os
+import unicodedata
+from itertools import islice
+import numpy as np
+import config
+import instrumentation
+import sentence_store
+
+# code points counted as letters: alphabetic, not format (Cf), within Basic Latin to Latin Extended-B, and with
+# full_latin_range every alphabetic code point named LATIN up to the end of Latin Extended-G
+latin_end = 0x0250
+full_latin_end = 0x1E000
+block_lines = 10_000
+# sentences per strided block when sampling_tolerance is set, convergence is checked after each block
+sampling_block_lines = 2_000
+
+max_multigraph_length = 3
+# characters matched as another one in multigraphs, so Breton "c’h" is found whichever apostrophe the text uses
+multigraph_aliases = {"’": "'"}
+
+# bump when counting rules change in a way the letter table does not capture, to invalidate cached counts
+counting_version = 3
+counts_cache_folder = "counts_cache"
+
+
+def build_letter_table(full_latin_range):
+    table = np.zeros(full_latin_end if full_latin_range else latin_end, dtype=bool)
+    for code_point in range(len(table)):
+        char = chr(code_point)
+        if code_point < latin_end:
+            table[code_point] = char.isalpha() and not unicodedata.category(char).startswith('Cf')
+        else:
+            table[code_point] = char.isalpha() and unicodedata.name(char, "").startswith("LATIN ")
+    return table
+
+
+# built once per process, counting then classifies whole blocks with table lookups instead of per character calls
+letter_table = build_letter_table(config.full_latin_range)
+letter_code_points = np.flatnonzero(letter_table)
+letter_count = len(letter_code_points)
+# count column of each code point in the table, letter_count for non-letters and code points past the table
+letter_columns = np.full(len(letter_table) + 1, letter_count, dtype=np.intp)
+letter_columns[letter_code_points] = np.arange(letter_count)
+
+
+def get_multigraphs():
+    return read_multigraphs() if config.count_multigraphs else []
+
+
+def read_multigraphs():
+    # multi-letter units from the letters files of all languages, counted in every language like single letters
+    multigraphs = set(config.extra_multigraphs)
+    for language in config.languages:
+        file_path = f"letters/{language}-letters.txt"
+        if os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as file:
+                multigraphs.update(letter for letter in json.load(file).get("letters", []) if len(letter) > 1)
+    multigraphs = sorted({multigraph.lower() for multigraph in multigraphs})
+    for multigraph in multigraphs:
+        if len(multigraph) > max_multigraph_length:
+            raise Exception(f'multigraph {multigraph!r} is longer than {max_multigraph_length} characters')
+    return multigraphs
+
+
+def get_units(multigraphs):
+    # count columns: one per letter in code point order, then one per multigraph
+    return [chr(code_point) for code_point in letter_code_points.tolist()] + list(multigraphs)
+
+
+def build_multigraph_index(multigraphs):
+    # a two-step automaton over the characters used in multigraphs (symbol 0 is any other character):
+    # pair_columns maps a symbol pair to its digraph's count column, pair_states to the row of triple_columns
+    # holding the trigraphs that start with that pair
+    if not multigraphs:
+        return None
+    chars = sorted({multigraph_aliases.get(char, char) for multigraph in multigraphs for char in multigraph})
+    aliases = [alias for alias, char in multigraph_aliases.items() if char in chars]
+    symbols = np.zeros(max(map(ord, chars + aliases)) + 2, dtype=np.intp)
+    for symbol, char in enumerate(chars, 1):
+        symbols[ord(char)] = symbol
+    for alias in aliases:
+        symbols[ord(alias)] = symbols[ord(multigraph_aliases[alias])]
+    size = len(chars) + 1
+
+    pair_columns = np.full(size * size, -1, dtype=np.int64)
+    pair_states = np.full(size * size, -1, dtype=np.int64)
+    triple_columns = []
+    for column, multigraph in enumerate(multigraphs, letter_count):
+        pair = symbols[ord(multigraph[0])] * size + symbols[ord(multigraph[1])]
+        if len(multigraph) == 2:
+            pair_columns[pair] = column
+            continue
+        if pair_states[pair] < 0:
+            pair_states[pair] = len(triple_columns)
+            triple_columns.append(np.full(size, -1, dtype=np.int64))
+        triple_columns[pair_states[pair]][symbols[ord(multigraph[2])]] = column
+    triple_columns = np.concatenate(triple_columns) if triple_columns else np.zeros(0, dtype=np.int64)
+    return symbols, size, pair_columns, pair_states, triple_columns
+
+
+def select_leftmost(starts, length):
+    # which of the matches of one length at sorted starts a left to right scan keeps: a match is dropped when a
+    # kept one before it overlaps it. each step settles the matches whose overlapping predecessors are settled,
+    # so text without overlaps takes a single step
+    kept = np.zeros(len(starts), dtype=bool)
+    settled = np.zeros(len(starts), dtype=bool)
+    overlaps = []
+    for shift in range(1, length):
+        overlap = np.zeros(len(starts), dtype=bool)
+        overlap[shift:] = starts[shift:] - starts[:-shift] < length
+        overlaps.append((shift, overlap))
+    while not settled.all():
+        blocked = np.zeros(len(starts), dtype=bool)
+        waiting = np.zeros(len(starts), dtype=bool)
+        for shift, overlap in overlaps:
+            blocked[shift:] |= overlap[shift:] & kept[:-shift]
+            waiting[shift:] |= overlap[shift:] & ~settled[:-shift]
+        settling = ~settled & (blocked | ~waiting)
+        kept |= settling & ~blocked
+        settled |= settling
+    return kept
+
+
+def find_multigraphs(code_points, multigraph_index):
+    # positions and count columns of the multigraph occurrences, in one vectorised step per character over
+    # positions that start with a multigraph character, no per-multigraph rescans. longest match first: a
+    # trigraph consumes its characters, so Hungarian "dzs" does not also count "dz" and "zs", and of overlapping
+    # units of the same length the leftmost is kept ("szs" is "sz" then "s")
+    symbols, size, pair_columns, pair_states, triple_columns = multigraph_index
+    text_symbols = symbols[np.minimum(code_points, np.uint32(len(symbols) - 1))]
+    starts = np.flatnonzero(text_symbols[:-1])
+    pairs = text_symbols[starts] * size + text_symbols[starts + 1]
+    pair_matches = pair_columns[pairs]
+
+    states = pair_states[pairs]
+    triples = (states >= 0) & (starts + 2 < len(text_symbols))
+    triple_starts = starts[triples]
+    triple_matches = triple_columns[states[triples] * size + text_symbols[triple_starts + 2]]
+    found = triple_matches >= 0
+    triple_starts, triple_matches = triple_starts[found], triple_matches[found]
+    kept = select_leftmost(triple_starts, 3)
+    triple_starts, triple_matches = triple_starts[kept], triple_matches[kept]
+
+    found = pair_matches >= 0
+    pair_starts, pair_matches = starts[found], pair_matches[found]
+    # a digraph at s overlaps the trigraphs starting from s - 2 to s + 1
+    free = np.searchsorted(triple_starts, pair_starts - 2) == np.searchsorted(triple_starts, pair_starts + 2)
+    pair_starts, pair_matches = pair_starts[free], pair_matches[free]
+    kept = select_leftmost(pair_starts, 2)
+    return np.concatenate((pair_starts[kept], triple_starts)), np.concatenate((pair_matches[kept], triple_matches))
+
+
+def get_code_points(text):
+    # decomposed diacritics are composed first when counting the full Latin range
+    if config.full_latin_range:
+        text = unicodedata.normalize("NFC", text)
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+
+def open_sentence_store(sentences_file):
+    return sentence_store.open_store(sentences_file) if config.use_sentence_store else None
+
+
+def count_code_points(code_points, counts, multigraph_index=None):
+    if multigraph_index is not None:
+        _, columns = find_multigraphs(code_points, multigraph_index)
+        counts += np.bincount(columns, minlength=len(counts))
+    columns = letter_columns[np.minimum(code_points, np.uint32(len(letter_table)))]
+    counts[:letter_count] += np.bincount(columns, minlength=letter_count + 1)[:letter_count]
+
+
+def read_blocks(sentences_file, max_lines, held_out_lines=()):
+    # code points and line count of each block of up to block_lines lines, leaving out the sorted held_out_lines.
+    # blocks are sliced from the sentence store when there is an up to date one, and gathered around the held-out
+    # lines when a block has some
+    held_out_lines = np.asarray(held_out_lines, dtype=np.int64)
+    store = open_sentence_store(sentences_file)
+    if store is not None:
+        max_lines = min(max_lines, store["sentences"])
+        for start in range(0, max_lines, block_lines):
+            end = min(start + block_lines, max_lines)
+            skipped = held_out_lines[np.searchsorted(held_out_lines, start):np.searchsorted(held_out_lines, end)]
+            if len(skipped):
+                lines = np.setdiff1d(np.arange(start, end), skipped)
+                yield sentence_store.gather_lines(store, lines), len(lines)
+            else:
+                yield sentence_store.get_lines(store, start, end), end - start
+        return
+
+    read_lines = 0
+    with open(sentences_file, "r", encoding="utf-8") as file:
+        while read_lines < max_lines:
+            block = list(islice(file, min(block_lines, max_lines - read_lines)))
+            if not block:
+                break
+            start = read_lines
+            read_lines += len(block)
+            skipped = held_out_lines[np.searchsorted(held_out_lines, start):np.searchsorted(held_out_lines, read_lines)]
+            if len(skipped):
+                skipped = set((skipped - start).tolist())
+                block = [line for at, line in enumerate(block) if at not in skipped]
+            yield get_code_points("".join(block)), len(block)
+
+
+def count_letters(sentences_file, max_lines, language=None, multigraphs=(), held_out_lines=()):
+    multigraph_index = build_multigraph_index(multigraphs)
+    counts = np.zeros(letter_count + len(multigraphs), dtype=np.int64)
+    read_lines = 0
+    for code_points, lines in read_blocks(sentences_file, max_lines, held_out_lines):
+        count_code_points(code_points, counts, multigraph_index)
+        read_lines += lines
+        instrumentation.add_counter("sentences", lines)
+        instrumentation.add_counter("characters", len(code_points))
+        if language and read_lines % 10_000 == 0:
+            print(f'processed {read_lines} sentences for {language}')
+    return counts
+
+
+def get_alphabet_columns(language, multigraphs=()):
+    file_path = f"letters/{language}-letters.txt"
+    if not os.path.exists(file_path):
+        # no letters file yet (see all_available_languages), the alphabet is derived from the counts while sampling
+        return None
+    with open(file_path, "r", encoding="utf-8") as file:
+        letters = json.load(file).get("letters", [])
+    multigraph_columns = {multigraph: column for column, multigraph in enumerate(multigraphs, letter_count)}
+    columns = {int(letter_columns[ord(letter)]) for letter in letters if len(letter) == 1 and ord(letter) < len(letter_table) and letter_table[ord(letter)]}
+    columns.update(multigraph_columns[letter.lower()] for letter in letters if letter.lower() in multigraph_columns)
+    return np.array(sorted(columns), dtype=np.int64)
+
+
+def get_frequency_errors(counts, columns):
+    # half-widths of the Wilson score intervals of each letter's frequency, which stay wide for letters seen few or no times
+    total = max(int(counts[:letter_count].sum()), 1)
+    frequencies = counts[columns] / total
+    z = config.sampling_confidence
+    return frequencies, z / (1 + z * z / total) * np.sqrt(frequencies * (1 - frequencies) / total + z * z / (4 * total * total))
+
+
+def get_derived_columns(counts):
+    # the letters main.derive_language_letters would keep from these counts, the alphabet of a language without a letters file
+    frequencies = counts[:letter_count] / max(int(counts[:letter_count].sum()), 1)
+    return np.flatnonzero(frequencies >= config.derived_alphabet_min_frequency)
+
+
+def is_sampling_converged(counts, columns):
+    # an alphabet letter not seen yet never counts as converged, however many sentences were read, nor does an
+    # empty alphabet (a derived one before any letter was counted)
+    frequencies, errors = get_frequency_errors(counts, columns)
+    return len(columns) > 0 and (counts[columns] > 0).all() and (errors <= config.sampling_tolerance * np.maximum(frequencies, config.sampling_min_frequency)).all()
+
+
+def count_letters_sampled(sentences_file, max_lines, columns, language=None, multigraphs=(), held_out_lines=()):
+    # counts strided blocks of lines spread over the whole file (lines k, k + stride, k + 2 * stride...) and
+    # stops once every alphabet letter's frequency is within sampling_tolerance, letters rarer than
+    # sampling_min_frequency are held to the error allowed at that frequency. columns is None for a language
+    # without a letters file, its alphabet is then the letters above derived_alphabet_min_frequency so far. the
+    # strided lines are read from the sentence store, which is built first if there is none, so stopping early
+    # also skips reading the rest
+    store = sentence_store.update_store(sentences_file)
+    counted_lines = np.setdiff1d(np.arange(min(max_lines, store["sentences"])), held_out_lines)
+    available_lines = len(counted_lines)
+    stride = max(math.ceil(available_lines / sampling_block_lines), 1)
+
+    multigraph_index = build_multigraph_index(multigraphs)
+    units = get_units(multigraphs)
+    counts = np.zeros(len(units), dtype=np.int64)
+    read_lines = 0
+    converged = False
+    for offset in range(stride):
+        block = counted_lines[offset::stride]
+        code_points = sentence_store.gather_lines(store, block)
+        count_code_points(code_points, counts, multigraph_index)
+        read_lines += len(block)
+        instrumentation.add_counter("sentences", len(block))
+        instrumentation.add_counter("characters", len(code_points))
+
+        if is_sampling_converged(counts, columns if columns is not None else get_derived_columns(counts)):
+            converged = offset < stride - 1
+            break
+
+    if columns is None:
+        columns = get_derived_columns(counts)
+    frequencies, errors = get_frequency_errors(counts, columns)
+    relative_errors = {units[column]: round(float(error / frequency), 4) for column, frequency, error in zip(columns.tolist(), frequencies, errors) if frequency > 0}
+    worst = max(relative_errors, key=relative_errors.get, default=None)
+    sampling = {
+        "sentences": read_lines,
+        "available_sentences": available_lines,
+        "converged": converged,
+        "max_relative_error": relative_errors.get(worst, 0),
+        "relative_errors": relative_errors,
+    }
+    if language:
+        stop = f'stopped after {read_lines}' if converged else f'counted all {read_lines}'
+        print(f'{language}: {stop} of {available_lines} sentences, max relative error {sampling["max_relative_error"]:.1%} ({worst})')
+    return counts, sampling
+
+
+def hash_file(hasher, file_path):
+    if not os.path.exists(file_path):
+        hasher.update(b"missing")
+        return
+    with open(file_path, "rb") as file:
+        while chunk := file.read(1 << 20):
+            hasher.update(chunk)
+
+
+def hash_sentences(hasher, sentences_file):
+    # by the sha256 of the file, which an up to date sentence store already holds
+    store = open_sentence_store(sentences_file)
+    if store is not None:
+        hasher.update(store["sha256"].encode())
+        return
+    file_hasher = hashlib.sha256()
+    hash_file(file_hasher, sentences_file)
+    hasher.update(file_hasher.hexdigest().encode())
+
+
+def get_counting_settings(multigraphs):
+    # everything besides the sentences and letters files that changes counts, saved with the frequency matrix so
+    # `main.py update` only merges counts made the same way
+    return json.dumps({
+        "version": counting_version,
+        "use_sentences_count": config.use_sentences_count,
+        "evaluation_sentences_count": config.evaluation_sentences_count,
+        "evaluation_seed": config.evaluation_seed,
+        "sampling": [config.sampling_tolerance, config.sampling_min_frequency, config.sampling_confidence, sampling_block_lines] if config.sampling_tolerance is not None else None,
+        "full_latin_range": config.full_latin_range,
+        "multigraphs": multigraphs,
+    }, ensure_ascii=False)
+
+
+def get_counts_cache_key(language, multigraphs):
+    hasher = hashlib.sha256()
+    hasher.update(f"{counting_version};{config.use_sentences_count};{config.evaluation_sentences_count};{config.evaluation_seed};{json.dumps(multigraphs)};".encode())
+    if config.sampling_tolerance is not None:
+        hasher.update(f"{config.sampling_tolerance};{config.sampling_min_frequency};{config.sampling_confidence};{sampling_block_lines};".encode())
+    hasher.update(letter_table.tobytes())
+    hash_sentences(hasher, os.path.join("corpora_files_extracted", f"{language}_sentences.txt"))
+    hash_file(hasher, f"letters/{language}-letters.txt")
+    return hasher.hexdigest()
+
+
+def load_cached_counts(language, cache_key):
+    cache_file = os.path.join(counts_cache_folder, f"{language}.json")
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, "r", encoding="utf-8") as file:
+            data = json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"error reading cached counts {cache_file}: {e}")
+        return None
+    if data.get("key") != cache_key:
+        print(f'cached counts for {language} are outdated')
+        return None
+    print(f'found cached counts: {cache_file}')
+    return data
+
+
+def save_cached_counts(language, cache_key, counts, multigraphs, sampling=None):
+    os.makedirs(counts_cache_folder, exist_ok=True)
+    cache_file = os.path.join(counts_cache_folder, f"{language}.json")
+    data = {"key": cache_key, "counts": counts_to_dict(counts, multigraphs)}
+    if sampling:
+        data["sampling"] = sampling
+    with open(cache_file + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False)
+    os.replace(cache_file + ".tmp", cache_file)
+
+
+def count_lines(file_path):
+    store = open_sentence_store(file_path)
+    if store is not None:
+        return store["sentences"]
+    with open(file_path, "rb") as file:
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: file.read(1 << 20), b"")) + 1
+
+
+def get_held_out_lines(sentences_file):
+    # evaluation_sentences_count lines picked at random from the whole file with evaluation_seed, sorted. they are
+    # held out for `main.py evaluate` and never counted
+    if not config.evaluation_sentences_count:
+        return np.zeros(0, dtype=np.int64)
+    lines = count_lines(sentences_file)
+    return np.sort(np.random.default_rng(config.evaluation_seed).choice(lines, min(config.evaluation_sentences_count, lines), replace=False))
+
+
+def get_counted_lines(held_out_lines):
+    # how many lines from the start of the file to read so that use_sentences_count of them are not held out. the
+    # held-out line at sorted index i has held_out_lines[i] - i counted lines before it
+    return config.use_sentences_count + int(np.count_nonzero(held_out_lines - np.arange(len(held_out_lines)) < config.use_sentences_count))
+
+
+def count_language(language):
+    multigraphs = get_multigraphs()
+    cache_key = get_counts_cache_key(language, multigraphs)
+    data = load_cached_counts(language, cache_key)
+    if data is not None:
+        if "sampling" in data:
+            instrumentation.set_metric("sampling", data["sampling"])
+        return dict_to_counts(data["counts"], multigraphs)
+
+    sentences_file = os.path.join("corpora_files_extracted", f"{language}_sentences.txt")
+    held_out_lines = get_held_out_lines(sentences_file)
+    max_lines = get_counted_lines(held_out_lines)
+    sampling = None
+    with instrumentation.profile(f"count_{language}"):
+        if config.sampling_tolerance is None:
+            counts = count_letters(sentences_file, max_lines, language, multigraphs, held_out_lines)
+        else:
+            counts, sampling = count_letters_sampled(sentences_file, max_lines, get_alphabet_columns(language, multigraphs), language, multigraphs, held_out_lines)
+            instrumentation.set_metric("sampling", sampling)
+    save_cached_counts(language, cache_key, counts, multigraphs, sampling)
+    return counts
+
+
+def counts_to_dict(counts, multigraphs=()):
+    units = get_units(multigraphs)
+    return {units[column]: int(counts[column]) for column in np.flatnonzero(counts)}
+
+
+def dict_to_counts(letter_counts, multigraphs=()):
+    columns = {unit: column for column, unit in enumerate(get_units(multigraphs))}
+    counts = np.zeros(len(columns), dtype=np.int64)
+    for letter, count in letter_counts.items():
+        counts[columns[letter]] = count
+    return counts
@@ -0,0 +1,77 @@
+import os
+import unicodedata
+import numpy as np
+import config
+import counting
+import sentence_store
+
+# checks the ranked letters on sentences left out of counting: after learning the first k letters, a sentence is
+# narrowed to its language when it contains at least one learned letter and every learned letter in it is used by
+# that language, and identified when that language is the only one using all of them
+
+
+def get_held_out_sentences(language):
+    sentences_file = os.path.join("corpora_files_extracted", f"{language}_sentences.txt")
+    held_out_lines = counting.get_held_out_lines(sentences_file)
+    store = counting.open_sentence_store(sentences_file)
+    if store is not None:
+        # only the held-out lines of the store are decoded
+        return [line for line in sentence_store.decode(sentence_store.gather_lines(store, held_out_lines)).split("\n") if line]
+    with open(sentences_file, "r", encoding="utf-8") as file:
+        lines = file.read().split("\n")
+    return [lines[line] for line in held_out_lines.tolist() if lines[line]]
+
+
+def get_letter_presence(sentences, letters):
+    # sentences x letters, whether each ranked letter or multigraph occurs in each sentence
+    lengths = np.array([len(sentence) + 1 for sentence in sentences], dtype=np.intp)
+    code_points = np.frombuffer("\n".join(sentences).encode("utf-32-le"), dtype=np.uint32)
+    sentence_ids = np.repeat(np.arange(len(sentences)), lengths)[:len(code_points)]
+    presence = np.zeros((len(sentences), len(letters)), dtype=bool)
+
+    ranks = np.full(len(counting.letter_table) + 1, -1, dtype=np.intp)
+    multigraphs = []
+    multigraph_ranks = []
+    for rank, letter in enumerate(letters):
+        if len(letter) == 1:
+            ranks[ord(letter)] = rank
+        else:
+            multigraphs.append(letter)
+            multigraph_ranks.append(rank)
+
+    letter_ranks = ranks[np.minimum(code_points, len(counting.letter_table))]
+    found = letter_ranks >= 0
+    presence[sentence_ids[found], letter_ranks[found]] = True
+
+    if multigraphs:
+        positions, columns = counting.find_multigraphs(code_points, counting.build_multigraph_index(multigraphs))
+        presence[sentence_ids[positions], np.array(multigraph_ranks, dtype=np.intp)[columns - counting.letter_count]] = True
+    return presence
+
+
+def evaluate_language(task):
+    # counts of sentences narrowed and identified for every prefix length of the ranking
+    language_index, language, letters, members = task
+    sentences = get_held_out_sentences(language)
+    if config.full_latin_range:
+        sentences = [unicodedata.normalize("NFC", sentence) for sentence in sentences]
+    presence = get_letter_presence(sentences, letters)
+
+    candidates = np.ones((len(sentences), members.shape[1]), dtype=bool)
+    seen = np.zeros(len(sentences), dtype=bool)
+    narrowed = np.zeros(len(letters), dtype=np.int64)
+    identified = np.zeros(len(letters), dtype=np.int64)
+    for rank in range(len(letters)):
+        rows = np.flatnonzero(presence[:, rank])
+        candidates[rows] &= members[rank]
+        seen[rows] = True
+        sentence_narrowed = seen & candidates[:, language_index]
+        narrowed[rank] = sentence_narrowed.sum()
+        identified[rank] = (sentence_narrowed & (candidates.sum(axis=1) == 1)).sum()
+    return {"sentences": len(sentences), "narrowed": narrowed.tolist(), "identified": identified.tolist()}
+
+
+def get_first_rank(counts, sentences, share):
+    # prefix length at which at least `share` of the sentences are counted, None if never
+    reached = np.flatnonzero(np.array(counts) >= share * sentences) if sentences else []
+    return int(reached[0]) + 1 if len(reached) else None
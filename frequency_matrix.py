@@ -0,0 +1,71 @@
+import numpy as np
+
+# a languages x letters table of raw counts plus everything derived from it, kept as plain arrays so it saves to one .npz
+#   languages (L,), letters (K,) single letters and multigraphs, speakers (L,)
+#   counts (L, K) raw letter counts, frequencies (L, K) counts over each language's total single letter count
+#   alphabet (L, K) whether the letter is in the language's letters file
+#   total_frequencies (K,) counts summed over all languages over the total letter count
+
+
+def build_frequency_matrix(languages, lang_counts, lang_alphabets, speakers, units):
+    # units are the letter or multigraph of each count column
+    counts = np.array(lang_counts, dtype=np.int64)
+    columns = np.flatnonzero(counts.sum(axis=0))
+    counts = counts[:, columns]
+    letters = np.array([units[column] for column in columns], dtype=str)
+
+    # multigraphs overlap the letters they are made of, so only single letters make up the totals
+    single_letters = np.array([len(units[column]) == 1 for column in columns], dtype=bool)
+    lang_totals = counts[:, single_letters].sum(axis=1)
+    frequencies = np.divide(counts, lang_totals[:, None], out=np.zeros(counts.shape), where=lang_totals[:, None] > 0)
+    alphabet = np.array([[letter in lang_alphabet for letter in letters.tolist()] for lang_alphabet in lang_alphabets], dtype=bool).reshape(counts.shape)
+
+    return {
+        "languages": np.array(languages, dtype=str),
+        "letters": letters,
+        "speakers": np.array(speakers, dtype=np.int64),
+        "counts": counts,
+        "frequencies": frequencies,
+        "alphabet": alphabet,
+        "total_frequencies": counts.sum(axis=0) / max(int(counts[:, single_letters].sum()), 1),
+    }
+
+
+def merge_frequency_matrices(matrices, languages, lang_alphabets, units):
+    # rows of matrices built with the same units, in the order of languages, the same matrix as counting them together
+    unit_columns = {unit: column for column, unit in enumerate(units)}
+    lang_counts = {}
+    lang_speakers = {}
+    for matrix in matrices:
+        columns = [unit_columns[letter] for letter in matrix["letters"].tolist()]
+        for at, language in enumerate(matrix["languages"].tolist()):
+            counts = np.zeros(len(units), dtype=np.int64)
+            counts[columns] = matrix["counts"][at]
+            lang_counts[language] = counts
+            lang_speakers[language] = int(matrix["speakers"][at])
+    return build_frequency_matrix(languages, [lang_counts[lang] for lang in languages], lang_alphabets, [lang_speakers[lang] for lang in languages], units)
+
+
+def save_frequency_matrix(matrix, file_path):
+    np.savez_compressed(file_path, **matrix)
+
+
+def load_frequency_matrix(file_path):
+    with np.load(file_path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def get_members(matrix):
+    # languages that use each letter: in the alphabet and seen in the corpus
+    return matrix["alphabet"] & (matrix["counts"] > 0)
+
+
+def get_letter_columns(matrix):
+    return {letter: column for column, letter in enumerate(matrix["letters"].tolist())}
+
+
+def sum_languages(values):
+    # adds rows one language at a time, so totals match summing language by language in Python exactly
+    if len(values) == 0:
+        return np.zeros(values.shape[1:])
+    return np.add.accumulate(values, axis=0)[-1]
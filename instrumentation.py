@@ -0,0 +1,135 @@
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+import config
+
+try:
+    import resource
+except ImportError:  # not available on Windows, peak memory is left out of the report there
+    resource = None
+
+report_file = "run_report.json"
+profiles_folder = "profiles"
+# peak memory of the scopes enclosing the current one, which resetting the peak for a nested scope would lose
+enclosing_peak_kb = 0
+
+# counters and other metrics for the current process, e.g. sentences counted or http bytes downloaded
+counters = {}
+report = {"stages": {}, "languages": {}}
+
+
+def add_counter(name, value=1):
+    counters[name] = counters.get(name, 0) + value
+
+
+def set_metric(name, value):
+    counters[name] = value
+
+
+def get_peak_rss_mb(who="self"):
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def read_scope_peak_kb():
+    # the peak resident memory since the last reset_scope_peak, None where Linux /proc is not available
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_scope_peak():
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+@contextmanager
+def measure(metrics):
+    global enclosing_peak_kb
+    outer_peak_kb = max(enclosing_peak_kb, read_scope_peak_kb() or 0)
+    enclosing_peak_kb = 0
+    scope_peak = reset_scope_peak()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield metrics
+    finally:
+        metrics["wall_time"] = round(time.perf_counter() - start_wall, 4)
+        metrics["cpu_time"] = round(time.process_time() - start_cpu, 4)
+        peak_kb = max(enclosing_peak_kb, read_scope_peak_kb() or 0)
+        enclosing_peak_kb = max(outer_peak_kb, peak_kb)
+        if scope_peak:
+            metrics["peak_rss_mb"] = round(peak_kb / 1024, 1)
+        else:
+            # without a resettable peak only the process maximum so far is known
+            metrics["max_rss_so_far_mb"] = get_peak_rss_mb()
+
+
+def measure_stage(name):
+    return measure(report["stages"].setdefault(name, {}))
+
+
+@contextmanager
+def profile(name):
+    if not config.profile_counting:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(profiles_folder, exist_ok=True)
+        profiler.dump_stats(os.path.join(profiles_folder, f"{name}.prof"))
+
+
+def run_measured(task):
+    # runs one language's work, possibly in a worker process, and returns its metrics with the result
+    function, language = task
+    outer_counters = dict(counters)
+    counters.clear()
+    metrics = {}
+    try:
+        with measure(metrics):
+            result = function(language)
+        metrics.update(counters)
+    finally:
+        counters.clear()
+        counters.update(outer_counters)
+    return result, metrics
+
+
+def record_language(language, stage, metrics):
+    metrics = dict(metrics)
+    for name in ("http_requests", "http_bytes"):
+        if name in metrics:
+            add_counter(name, metrics[name])
+    if metrics.get("sentences") and metrics["wall_time"] > 0:
+        metrics["sentences_per_second"] = round(metrics["sentences"] / metrics["wall_time"])
+        metrics["characters_per_second"] = round(metrics["characters"] / metrics["wall_time"])
+    report["languages"].setdefault(language, {})[stage] = metrics
+
+
+def write_report(command, metrics):
+    report["command"] = command
+    report["total"] = {**metrics, "children_peak_rss_mb": get_peak_rss_mb("children")}
+    report["http"] = {"requests": counters.get("http_requests", 0), "bytes": counters.get("http_bytes", 0)}
+    with open(report_file, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"saved run report to: {report_file}")
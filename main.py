@@ -1,108 +1,39 @@
+import argparse
+import functools
 import os
-import tarfile
-import requests
-import time
-from collections import defaultdict
-import unicodedata
-from bs4 import BeautifulSoup
 import re
-from langcodes import Language
+import time
+from concurrent.futures import ProcessPoolExecutor
 import config
 import json
+import numpy as np
+import frequency_matrix
+import instrumentation
+import scoring
+import speaker_counts
+import tracing
 
-corpus_base_url = "https://downloads.wortschatz-leipzig.de/corpora/"
+# requests, bs4 and langcodes are imported by the stages that use them, so `score` and `export` start quickly
 
-os.makedirs("corpora_files", exist_ok=True)
-os.makedirs("corpora_files_extracted", exist_ok=True)
-os.makedirs("letters", exist_ok=True)
-os.makedirs("speakers", exist_ok=True)
+available_languages_file = "available_languages.json"
+letter_frequencies_file = "letter_frequencies.npz"
+scored_letters_file = "scored_letters.json"
+evaluation_curves_file = "evaluation_curves.json"
 
-languages = config.languages
 
-def attempt_download(language, file_path):
-    if os.path.exists(file_path):
-        print(f"found tar: {file_path}")
-        return file_path
-
-    for size in config.corpus_sizes:
-        for year in config.corpus_years:
-            for corpus_type in config.corpus_types:
-                file_name = f"{language}_{corpus_type}_{year}_{size}.tar.gz"
-                download_url = f"{corpus_base_url}{file_name}"
-                print(f"attempting to download: {download_url}")
-
-                try:
-                    response = requests.get(download_url, stream=True)
-                    if response.status_code == 200:
-                        with open(file_path, "wb") as file:
-                            for chunk in response.iter_content(chunk_size=8192):
-                                file.write(chunk)
-                        print(f"downloaded and saved: {file_path}")
-                        return file_path
-                    else:
-                        print(f"file not found: {download_url} (HTTP {response.status_code})")
-                except Exception as e:
-                    print(f"error downloading {download_url}: {e}")
-
-                time.sleep(1)
-    print(f"no available corpus found for {language}.")
-    return None
-
-
-def extract_and_process_corpus(language, sentences_output_file):
-    if os.path.exists(sentences_output_file):
-        print(f'found sentences file: {sentences_output_file}')
-        with open(sentences_output_file, "r", encoding="utf-8") as file:
-            sentences = file.read().splitlines()
-        return sentences
-
-    save_file_path = f"corpora_files/{language}.tar.gz"
-    downloaded_file = attempt_download(language, save_file_path)
-    if not downloaded_file:
-        raise Exception(f'failed to download file {downloaded_file}')
-
-    extracted_path = os.path.join("corpora_files_extracted", language)
-    os.makedirs(extracted_path, exist_ok=True)
-
-    print(f"extracting: {save_file_path}")
-    with tarfile.open(save_file_path, "r:gz") as tar:
-        tar.extractall(path=extracted_path)
-
-    extracted_dirs = os.listdir(extracted_path)
-    if not extracted_dirs:
-        print(f"no folders found after extraction for {save_file_path}.")
-        return []
+def map_processes(function, items):
+    # results come back in item order, so merging is identical to the serial path
+    if config.workers > 1:
+        with ProcessPoolExecutor(max_workers=config.workers) as executor:
+            return list(executor.map(function, items))
+    return list(map(function, items))
 
-    target_folder = os.path.join(extracted_path, extracted_dirs[0])
-    sentences_file = None
 
-    for file_name in os.listdir(target_folder):
-        if file_name.endswith("-sentences.txt"):
-            sentences_file = os.path.join(target_folder, file_name)
-            break
-
-    if not sentences_file:
-        print(f"no `-sentences` file found in {target_folder}.")
-        return []
-
-    print(f"reading sentences from: {sentences_file}")
-    sentences = []
-    try:
-        with open(sentences_file, "r", encoding="utf-8", errors="replace") as file:
-            for line in file:
-                parts = line.split("\t", maxsplit=1)
-                if len(parts) > 1:
-                    sentence = parts[1].strip().lower()
-                    sentences.append(sentence)
-    except Exception as e:
-        print(f"failed to read sentences from {sentences_file}: {e}")
-        return []
-
-    with open(sentences_output_file, "w", encoding="utf-8") as file:
-        file.write("\n".join(sentences))
-        print(f"saved sentences to: {sentences_output_file}")
-
-    return sentences
+def map_languages(function, languages, stage):
+    results = map_processes(instrumentation.run_measured, [(function, language) for language in languages])
+    for language, (_, metrics) in zip(languages, results):
+        instrumentation.record_language(language, stage, metrics)
+    return [result for result, _ in results]
 
 
 def get_language_letters(code):
@@ -115,10 +46,7 @@ def get_language_letters(code):
 
 
 def build_letter_frequency(languages):
-    letter_frequencies = defaultdict(int)
-    lang_letter_frequencies = {lang: defaultdict(int) for lang in languages}
-    total_letters = {lang: 0 for lang in languages}
-    total_letter_count = 0
+    import counting
 
     for language in languages:
         sentences_file = os.path.join("corpora_files_extracted", f"{language}_sentences.txt")
@@ -126,54 +54,52 @@ def build_letter_frequency(languages):
             raise Exception(f'missing sentences for {language}')
             continue
 
-    for language in languages:
-        sentences_file = os.path.join("corpora_files_extracted", f"{language}_sentences.txt")
-
-        with open(sentences_file, "r", encoding="utf-8") as file:
-            for at, line in enumerate(file):
-                if (at + 1) % 10_000 == 0:
-                   print(f'processed {at + 1} sentences for {language}')
-                if at > config.use_sentences_count:
-                    break
-                for letter in remove_format_chars(line):
-                    if len(letter) == 1 and letter.isalpha() and is_latin_character(letter):
-                        lang_letter_frequencies[language][letter] += 1
-                        letter_frequencies[letter] += 1
-                        total_letters[language] += 1
-                        total_letter_count += 1
-
+    multigraphs = counting.get_multigraphs()
+    units = counting.get_units(multigraphs)
+    unit_columns = {unit: column for column, unit in enumerate(units)}
+    lang_counts = map_languages(counting.count_language, languages, "count")
+    lang_alphabets = []
+    for language, counts in zip(languages, lang_counts):
         lang_letters = get_language_letters(language)
+        if not lang_letters and config.all_available_languages:
+            lang_letters = derive_language_letters(counts, units)
+            print(f'no letters file for {language}, using the letters in its corpus')
         if not lang_letters:
             raise Exception(f'missing letters file for {language}')
+        lang_alphabets.append(lang_letters)
+        seen_letters = [letter for letter in set(lang_letters) if len(letter) == 1 and letter in unit_columns and counts[unit_columns[letter]] > 0]
+        print(f'finished {language}, {len(seen_letters)} letters: {" ".join(lang_letters)}')
 
-        lang_letter_frequencies[language] = {
-            letter: freq / total_letters[language]
-            for letter, freq in lang_letter_frequencies[language].items()
-            if letter in lang_letters
-        }
-        print(f'finished {language}, {len(lang_letter_frequencies[language])} letters: {" ".join(lang_letters)}')
-
-        #for key, val in lang_letter_frequencies[language].items():
-        #    print(f'{key}: {(val * 100):.1f}')
+    speakers = speaker_counts.load_language_speakers(languages, allow_missing=config.all_available_languages)
+    if len(speakers) < len(languages):
+        print(f'skipping languages without a speaker count: {", ".join(lang for lang in languages if lang not in speakers)}')
+        kept = [at for at, lang in enumerate(languages) if lang in speakers]
+        languages = [languages[at] for at in kept]
+        lang_counts = [lang_counts[at] for at in kept]
+        lang_alphabets = [lang_alphabets[at] for at in kept]
+    return frequency_matrix.build_frequency_matrix(languages, lang_counts, lang_alphabets, [speakers[lang] for lang in languages], units)
 
-    for letter, count in letter_frequencies.items():
-        letter_frequencies[letter] = letter_frequencies[letter] / total_letter_count
 
-    return lang_letter_frequencies, letter_frequencies
+def derive_language_letters(counts, units):
+    # letters at least derived_alphabet_min_frequency frequent in the corpus, for languages without a letters file
+    single_letters = np.array([len(unit) == 1 for unit in units], dtype=bool)
+    frequencies = counts / max(int(counts[single_letters].sum()), 1)
+    return [units[column] for column in np.flatnonzero(single_letters & (frequencies >= config.derived_alphabet_min_frequency))]
 
 
-def remove_format_chars(text):
-    return ''.join(ch for ch in text if not unicodedata.category(ch).startswith('Cf'))
+def fetch_available_languages():
+    import requests
+    from bs4 import BeautifulSoup
 
-
-def get_available_languages():
     print("fetching available languages from Wortschatz...")
     try:
         response = requests.get("https://wortschatz.uni-leipzig.de/en/download")
+        instrumentation.add_counter("http_requests")
+        instrumentation.add_counter("http_bytes", len(response.content))
         if response.status_code != 200:
             print(f"failed to fetch language list (HTTP {response.status_code}).")
             return []
-        
+
         soup = BeautifulSoup(response.text, "html.parser")
         language_links = soup.find_all("a", href=True, class_="btn btn-default btn-xs btn-modal")
         available_languages = [re.search(r'/download/(\w+)', link['href']).group(1) for link in language_links]
@@ -185,40 +111,47 @@ def get_available_languages():
         return []
 
 
-def is_latin_character(char):
-    return (
-        (0x0000 <= ord(char) <= 0x007F) or  # Basic Latin
-        (0x0080 <= ord(char) <= 0x00FF) or  # Latin-1 Supplement
-        (0x0100 <= ord(char) <= 0x017F) or  # Latin Extended-A
-        (0x0180 <= ord(char) <= 0x024F)     # Latin Extended-B
-    )
+def get_available_languages():
+    cached = None
+    if os.path.exists(available_languages_file):
+        with open(available_languages_file, "r", encoding="utf-8") as file:
+            cached = json.load(file)
+        if time.time() - cached["fetched_at"] < config.available_languages_ttl:
+            print(f"found available languages: {available_languages_file}")
+            return cached["languages"]
+
+    available_languages = fetch_available_languages()
+    if available_languages:
+        with open(available_languages_file, "w", encoding="utf-8") as file:
+            json.dump({"fetched_at": time.time(), "languages": available_languages}, file)
+        return available_languages
 
+    if cached:
+        print(f"using outdated available languages from {available_languages_file}")
+        return cached["languages"]
+    return []
 
-def is_latin_script(text, threshold=0.9):
-    total_chars = len(text)
-    if total_chars == 0:
-        return False
 
-    latin_count = sum(
-        1 for char in text
-        if is_latin_character(char)
-    )
-    return (latin_count / total_chars) >= threshold
+def get_languages():
+    available_languages = get_available_languages()
+    if config.all_available_languages:
+        print(f'languages: all {len(available_languages)} available')
+        return available_languages
+    languages = [lang for lang in config.languages if lang in available_languages]
 
-def check_language_script(language, sentences_file):
-    if not os.path.exists(sentences_file):
-        raise Exception(f'sentences file not found to check language for {language}')
+    if len(languages) < len(config.languages):
+        skipped_languages = set(config.languages) - set(languages)
+        print(f"skipping unsupported languages: {', '.join(skipped_languages)}")
 
-    try:
-        with open(sentences_file, "r", encoding="utf-8") as file:
-            text_sample = " ".join(file.readlines()[:1000])  # take first 1000 lines for analysis
-            return is_latin_script(text_sample)
-    except Exception as e:
-        print(f"error reading file for {language}: {e}")
-        return False
+    print('languages:')
+    print(languages)
+    return languages
 
 
+@functools.lru_cache(maxsize=None)
 def lang_code_to_name(lang_code):
+    from langcodes import Language
+
     try:
         language = Language.get(lang_code)
         return language.display_name()
@@ -226,177 +159,411 @@ def lang_code_to_name(lang_code):
         return f"[unknown language]"
 
 
-def get_language_speakers(code):
-    file_path = os.path.join("speakers", code + ".txt")
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as file:
-            return int(file.read())
-    else:
-        with open(file_path, "w", encoding="utf-8") as file:
-            speakers = fetch_language_speakers(code)
-            file.write(str(speakers))
-            return speakers
-
-
-def get_letter_speakers(letter):
-    return sum(map(get_language_speakers, get_languages_with_letter(letter)))
-
-
-def get_total_speakers():
-    return sum(map(get_language_speakers, languages))
-
-
-def fetch_language_speakers(code):
-    endpoint = "https://query.wikidata.org/sparql"
-    query = f"""
-    SELECT ?speakers WHERE {{
-        ?lang wdt:P219 '{code}'.
-        ?lang wdt:P1098 ?speakers.
-    }}
-    ORDER BY DESC(?speakers)
-    LIMIT 1
-    """
-    headers = {"Accept": "application/json", "user-agent": "python-bot"}
-    response = requests.get(endpoint, params={"query": query, "format": "json"}, headers=headers)
-
-    if response.status_code == 200:
-        data = response.json()
-        bindings = data.get("results", {}).get("bindings", [])
-        if bindings:
-            return int(float(bindings[0]["speakers"]["value"]))
-        else:
-            return None
-    else:
-        raise Exception(f"Error: {response.status_code}, {response.text}")
+def load_letter_frequencies():
+    if not os.path.exists(letter_frequencies_file):
+        raise Exception(f'missing {letter_frequencies_file}, run the count stage first')
+    return frequency_matrix.load_frequency_matrix(letter_frequencies_file)
+
+
+def load_scored_letters():
+    if not os.path.exists(scored_letters_file):
+        raise Exception(f'missing {scored_letters_file}, run the score stage first')
+    with open(scored_letters_file, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def load_scoring_matrix():
+    # speakers are reloaded so edits to the speakers folder apply without recounting
+    matrix = load_letter_frequencies()
+    languages = matrix["languages"].tolist()
+    language_speakers = speaker_counts.load_language_speakers(languages)
+    matrix["speakers"] = np.array([language_speakers[lang] for lang in languages], dtype=np.int64)
+    return matrix
+
+
+def get_all_letters(matrix):
+    letter_columns = frequency_matrix.get_letter_columns(matrix)
+    all_letters = set()
+    for at, lang in enumerate(matrix["languages"].tolist()):
+        # languages without a letters file use the letters derived from their corpus when counting
+        for letter in get_language_letters(lang) or matrix["letters"][matrix["alphabet"][at]].tolist():
+            all_letters.add(letter)
+    all_letters = list(all_letters)
+
+    return [letter for letter in all_letters if letter in letter_columns]
+
+
+def get_candidates(matrix, all_letters, max_languages):
+    letter_columns = frequency_matrix.get_letter_columns(matrix)
+    language_counts = frequency_matrix.get_members(matrix).sum(axis=0)
+    return [letter_columns[letter] for letter in all_letters if language_counts[letter_columns[letter]] <= max_languages]
+
+
+def fetch_corpora():
+    import corpus
 
+    os.makedirs("corpora_files", exist_ok=True)
+    os.makedirs("corpora_files_extracted", exist_ok=True)
+    os.makedirs("letters", exist_ok=True)
+    os.makedirs("speakers", exist_ok=True)
 
-def get_languages_with_letter(letter):
-    return [
-        lang for lang in languages
-        if letter in lang_letter_frequencies[lang]
-    ]
+    map_languages(corpus.prepare_language, get_languages(), "fetch")
 
-available_languages = get_available_languages()
-filtered_languages = [lang for lang in languages if lang in available_languages]
 
-if len(filtered_languages) < len(languages):
-    skipped_languages = set(languages) - set(filtered_languages)
-    print(f"skipping unsupported languages: {', '.join(skipped_languages)}")
-languages = filtered_languages
+def get_latin_languages(languages):
+    # with all_available_languages, the languages that were fetched and use latin script
+    import corpus
 
-print('languages:')
-print(languages)
+    latin_languages = []
+    for language in languages:
+        sentences_file = os.path.join("corpora_files_extracted", f"{language}_sentences.txt")
+        if os.path.exists(sentences_file) and corpus.check_language_script(language, sentences_file):
+            latin_languages.append(language)
+    print(f'counting {len(latin_languages)} latin script languages out of {len(languages)}')
+    return latin_languages
+
+
+def save_letter_frequencies(matrix):
+    import counting
+
+    # lets `evaluate` check that its held-out sentences were not counted and `update` that counts can be merged
+    matrix["evaluation_sentences_count"] = np.array(config.evaluation_sentences_count)
+    matrix["evaluation_seed"] = np.array(config.evaluation_seed)
+    matrix["counting_settings"] = np.array(counting.get_counting_settings(counting.get_multigraphs()))
+    frequency_matrix.save_frequency_matrix(matrix, letter_frequencies_file)
+    print(f'saved letter frequencies to: {letter_frequencies_file}')
+
+
+def count_letters():
+    languages = get_languages()
+    if config.all_available_languages:
+        languages = get_latin_languages(languages)
+    save_letter_frequencies(build_letter_frequency(languages))
+
+
+def update_letter_frequencies():
+    # fetches and counts only the languages added to `languages` since the last count, drops the removed ones and
+    # merges the saved counts of the others, giving the same matrix as counting them all again
+    import corpus
+    import counting
+
+    matrix = load_letter_frequencies()
+    multigraphs = counting.get_multigraphs()
+    if str(matrix.get("counting_settings", "")) != counting.get_counting_settings(multigraphs):
+        raise Exception(f'{letter_frequencies_file} was counted with other settings, run the count stage')
+
+    old_languages = matrix["languages"].tolist()
+    languages = get_languages()
+    added = [lang for lang in languages if lang not in old_languages]
+    removed = [lang for lang in old_languages if lang not in languages]
+    if not added and not removed:
+        print('letter frequencies are up to date')
+        return
+
+    matrices = [matrix]
+    if added:
+        os.makedirs("corpora_files", exist_ok=True)
+        os.makedirs("corpora_files_extracted", exist_ok=True)
+        map_languages(corpus.prepare_language, added, "fetch")
+        if config.all_available_languages:
+            added = get_latin_languages(added)
+        if added:
+            matrices.append(build_letter_frequency(added))
+    counted_languages = {lang for counted_matrix in matrices for lang in counted_matrix["languages"].tolist()}
+    languages = [lang for lang in languages if lang in counted_languages]
+
+    lang_alphabets = []
+    for lang in languages:
+        counted_matrix = next(counted_matrix for counted_matrix in matrices if lang in counted_matrix["languages"].tolist())
+        at = counted_matrix["languages"].tolist().index(lang)
+        lang_alphabets.append(get_language_letters(lang) or counted_matrix["letters"][counted_matrix["alphabet"][at]].tolist())
+
+    print(f'added {", ".join(lang for lang in languages if lang not in old_languages) or "no languages"}, removed {", ".join(removed) or "no languages"}')
+    save_letter_frequencies(frequency_matrix.merge_frequency_matrices(matrices, languages, lang_alphabets, counting.get_units(multigraphs)))
+
+
+def score_letters():
+    matrix = load_scoring_matrix()
+    languages = matrix["languages"].tolist()
+    members = frequency_matrix.get_members(matrix)
+    letter_columns = frequency_matrix.get_letter_columns(matrix)
+    letter_speakers = (members * matrix["speakers"][:, None]).sum(axis=0)
+
+    def get_languages_with_letter(letter):
+        return [languages[lang] for lang in np.flatnonzero(members[:, letter_columns[letter]])]
+
+    all_letters = get_all_letters(matrix)
+    candidates = get_candidates(matrix, all_letters, config.max_languages)
+
+    total_pop = int(matrix["speakers"].sum())
+    letters_pop = dict(zip(matrix["letters"][candidates].tolist(), letter_speakers[candidates].tolist()))
+    weighted_total_letter_frequencies = dict(zip(matrix["letters"].tolist(), (matrix["total_frequencies"] * (letter_speakers / total_pop)).tolist()))
+
+    # everything the round output needs besides the scores is looked up once here
+    candidate_letters = matrix["letters"][candidates].tolist()
+    header = {
+        "candidates": candidate_letters,
+        "letters": {
+            letter: {
+                "speakers": int(letter_speakers[letter_columns[letter]]),
+                "frequency": float(matrix["total_frequencies"][letter_columns[letter]]),
+                "languages": get_languages_with_letter(letter),
+            }
+            for letter in candidate_letters
+        },
+        "language_names": {lang: lang_code_to_name(lang) for lang in languages},
+    }
+    trace = tracing.open_trace(tracing.trace_file, header) if config.trace_selection else None
+
+    def trace_round(scores, chosen, chosen_score, deweights):
+        round_record = {"scores": list(scores.values()), "chosen": chosen, "score": chosen_score, "deweights": deweights}
+        if trace:
+            tracing.write_round(trace, round_record)
+        lines = tracing.format_round(header, list(scores), round_record, config.round_log_verbosity)
+        if lines:
+            print("\n".join(lines))
+
+    try:
+        with instrumentation.measure_stage("selection"):
+            scored_letters = scoring.rank_letters(
+                matrix,
+                candidates,
+                config.assumed_text_length,
+                config.extra_language_deweight,
+                on_round=trace_round,
+            )
+    finally:
+        if trace:
+            trace.close()
+    if trace:
+        print(f'saved selection trace to: {tracing.trace_file}')
+
+    with open(scored_letters_file, "w", encoding="utf-8") as file:
+        json.dump({"all_letters": all_letters, "scored_letters": list(scored_letters.items())}, file, ensure_ascii=False)
+    print(f'saved scored letters to: {scored_letters_file}')
+
+
+def export_results():
+    matrix = load_letter_frequencies()
+    languages = matrix["languages"].tolist()
+    data = load_scored_letters()
+    all_letters = data["all_letters"]
+    scored_letters = dict(data["scored_letters"])
+
+    letter_columns = frequency_matrix.get_letter_columns(matrix)
+    scored_members = frequency_matrix.get_members(matrix)[:, [letter_columns[letter] for letter in scored_letters]]
+    letter_names = [", ".join(lang_code_to_name(languages[lang]) for lang in np.flatnonzero(column)) for column in scored_members.T]
+    covered = scored_members.any(axis=1)
+    distinctly_covered = scored_members[:, scored_members.sum(axis=0) == 1].any(axis=1)
+
+    # printed as it goes and written to results_log.txt once at the end
+    log_lines = []
+
+    def printAndFileLog(text):
+        print(text)
+        log_lines.append(text + "\n")
+
+    markdown_table_string = (
+        "Rank|Letter|Naive score|Languages|"
+        "\n|----|------|-----------|---------|"
+        "\n"
+    )
+    anki_csv_string = ""
+    printAndFileLog("results:")
+    for at, ((letter, score), names) in enumerate(zip(scored_letters.items(), letter_names)):
+        printAndFileLog(f'{letter} score: {score:.0f} langs: {names}')
+        anki_csv_string += f'{letter.upper()};{letter};{at};{score:.0f};{names}\n'
+        markdown_table_string += f'{at + 1}|{letter.upper()} {letter}|{score:.0f}|{names}|\n'
+
+    with open("anki_letters.csv", "w", encoding="utf-8") as file:
+        file.write(anki_csv_string)
+
+    with open("markdown_table.md", "w", encoding="utf-8") as file:
+        file.write(markdown_table_string)
 
-for language in languages:
-    sentences_output_file = os.path.join("corpora_files_extracted", f"{language}_sentences.txt")
+    def language_names(mask):
+        return ", ".join(lang_code_to_name(languages[lang]) for lang in np.flatnonzero(mask))
 
-    extract_and_process_corpus(language, sentences_output_file)
+    printAndFileLog(f'listed {len(scored_letters)} letters out of {len(all_letters)} total letters')
+    printAndFileLog(f'covered {covered.sum()}/{len(languages)} languages: {language_names(covered)}')
+    printAndFileLog(f'with distinct converage for {distinctly_covered.sum()}/{len(languages)} languages: {language_names(distinctly_covered)}')
+    printAndFileLog(f'missed languages: {language_names(~covered)}')
 
-    if not check_language_script(language, sentences_output_file):
-        raise Exception(f'language {language} does not use latin script')
+    with open("results_log.txt", "w", encoding="utf-8") as file:
+        file.write("".join(log_lines))
 
-def printAndFileLog(text):
-    print(text)
-    with open("results_log.txt", "a", encoding="utf-8") as file:
-        file.write(text + "\n")
 
-lang_letter_frequencies, total_letter_frequencies = build_letter_frequency(languages)
-all_letters = set()
-for lang in languages:
-    for letter in get_language_letters(lang):
-        all_letters.add(letter)
-all_letters = list(all_letters)
+def rank_sweep_point(task):
+    matrix, all_letters, params = task
+    candidates = get_candidates(matrix, all_letters, params["max_languages"])
+    scored_letters = scoring.rank_letters(matrix, candidates, params["assumed_text_length"], params["extra_language_deweight"])
 
-all_letters = [letter for letter in all_letters if len(letter) == 1 and total_letter_frequencies[letter] > 0]
+    letter_columns = frequency_matrix.get_letter_columns(matrix)
+    scored_members = frequency_matrix.get_members(matrix)[:, [letter_columns[letter] for letter in scored_letters]]
+    covered = int(scored_members.any(axis=1).sum())
+    distinctly_covered = int(scored_members[:, scored_members.sum(axis=0) == 1].any(axis=1).sum())
+    return list(scored_letters), covered, distinctly_covered
 
-def get_letter_chance(lang, letter):
-    freq = lang_letter_frequencies[lang][letter]
-    set_length = config.assumed_text_length
-    return 1 - (1 - freq) ** set_length
 
-letters_pop = {
-    letter: 0 for letter in all_letters if len(get_languages_with_letter(letter)) <= config.max_languages
+def get_sweep_params(args):
+    if args.configs:
+        with open(args.configs, "r", encoding="utf-8") as file:
+            params_list = json.load(file)
+    else:
+        params_list = [
+            {"max_languages": max_languages, "assumed_text_length": assumed_text_length, "extra_language_deweight": extra_language_deweight}
+            for max_languages in args.max_languages
+            for assumed_text_length in args.assumed_text_length
+            for extra_language_deweight in args.extra_language_deweight
+        ]
+    defaults = {"max_languages": config.max_languages, "assumed_text_length": config.assumed_text_length, "extra_language_deweight": config.extra_language_deweight}
+    return [{**defaults, **params} for params in params_list]
+
+
+def sweep_parameters(params_list, output_file):
+    # letters are counted once, then the greedy selection runs once per parameter set
+    matrix = load_scoring_matrix()
+    all_letters = get_all_letters(matrix)
+    print(f'sweeping {len(params_list)} parameter sets')
+    start = time.perf_counter()
+    results = map_processes(rank_sweep_point, [(matrix, all_letters, params) for params in params_list])
+    print(f'ranked {len(params_list)} parameter sets in {time.perf_counter() - start:.2f}s')
+
+    languages_count = len(matrix["languages"])
+    sweep_string = (
+        "Config|max_languages|assumed_text_length|extra_language_deweight|Letters|Covered|Distinctly covered|"
+        "\n|------|-------------|-------------------|-----------------------|-------|-------|------------------|"
+        "\n"
+    )
+    for at, (params, (ranking, covered, distinctly_covered)) in enumerate(zip(params_list, results)):
+        sweep_string += f'{at + 1}|{params["max_languages"]}|{params["assumed_text_length"]}|{params["extra_language_deweight"]}|{len(ranking)}|{covered}/{languages_count}|{distinctly_covered}/{languages_count}|\n'
+
+    # ranks per letter for every config, with the change relative to config 1
+    base_ranks = {letter: at + 1 for at, letter in enumerate(results[0][0])}
+    sweep_letters = list(results[0][0]) + sorted({letter for ranking, _, _ in results for letter in ranking} - set(base_ranks))
+    sweep_string += (
+        "\nLetter|" + "|".join(str(at + 1) for at in range(len(params_list))) + "|"
+        "\n|------|" + "|".join("-" * len(str(at + 1)) for at in range(len(params_list))) + "|"
+        "\n"
+    )
+    for letter in sweep_letters:
+        cells = []
+        for ranking, _, _ in results:
+            if letter not in ranking:
+                cells.append("-")
+                continue
+            rank = ranking.index(letter) + 1
+            change = base_ranks[letter] - rank if letter in base_ranks else None
+            cells.append(f'{rank}' if not change else f'{rank} ({change:+d})')
+        sweep_string += f'{letter.upper()} {letter}|' + "|".join(cells) + "|\n"
+
+    with open(output_file, "w", encoding="utf-8") as file:
+        file.write(sweep_string)
+    print(f'saved sweep results to: {output_file}')
+
+
+def evaluate_letters(output_file):
+    import evaluation
+
+    matrix = load_letter_frequencies()
+    held_out = int(matrix.get("evaluation_sentences_count", 0))
+    seed = int(matrix.get("evaluation_seed", -1))
+    if config.evaluation_sentences_count <= 0 or held_out != config.evaluation_sentences_count or seed != config.evaluation_seed:
+        raise Exception(f'letters were counted with {held_out} held-out sentences (seed {seed}), set evaluation_sentences_count and evaluation_seed and rerun the count stage')
+    languages = matrix["languages"].tolist()
+    letters = [letter for letter, _ in load_scored_letters()["scored_letters"]]
+
+    letter_columns = frequency_matrix.get_letter_columns(matrix)
+    members = frequency_matrix.get_members(matrix)[:, [letter_columns[letter] for letter in letters]].T
+    results = map_processes(evaluation.evaluate_language, [(at, language, letters, members) for at, language in enumerate(languages)])
+
+    sentences = sum(result["sentences"] for result in results)
+    narrowed = np.sum([result["narrowed"] for result in results], axis=0)
+    identified = np.sum([result["identified"] for result in results], axis=0)
+    with open(evaluation_curves_file, "w", encoding="utf-8") as file:
+        json.dump({
+            "letters": letters,
+            "overall": {"sentences": sentences, "narrowed": narrowed.tolist(), "identified": identified.tolist()},
+            "languages": dict(zip(languages, results)),
+        }, file, ensure_ascii=False)
+    print(f'saved coverage curves to: {evaluation_curves_file}')
+
+    evaluation_string = (
+        "Letters|Letter|Narrowed|Identified|"
+        "\n|-------|------|--------|----------|"
+        "\n"
+    )
+    for at, letter in enumerate(letters):
+        evaluation_string += f'{at + 1}|{letter.upper()} {letter}|{narrowed[at] / max(sentences, 1):.1%}|{identified[at] / max(sentences, 1):.1%}|\n'
+    evaluation_string += (
+        "\nLanguage|Sentences|Letters to narrow half|Narrowed|Identified|"
+        "\n|--------|---------|----------------------|--------|----------|"
+        "\n"
+    )
+    for language, result in zip(languages, results):
+        half = evaluation.get_first_rank(result["narrowed"], result["sentences"], 0.5)
+        final_narrowed = result["narrowed"][-1] / max(result["sentences"], 1) if letters else 0
+        final_identified = result["identified"][-1] / max(result["sentences"], 1) if letters else 0
+        evaluation_string += f'{lang_code_to_name(language)}|{result["sentences"]}|{half or "-"}|{final_narrowed:.1%}|{final_identified:.1%}|\n'
+
+    with open(output_file, "w", encoding="utf-8") as file:
+        file.write(evaluation_string)
+    if letters:
+        print(f'all {len(letters)} letters narrow {narrowed[-1] / max(sentences, 1):.1%} and identify {identified[-1] / max(sentences, 1):.1%} of {sentences} held-out sentences')
+    print(f'saved evaluation table to: {output_file}')
+
+
+stages = {
+    "fetch": fetch_corpora,
+    "count": count_letters,
+    "score": score_letters,
+    "export": export_results,
 }
 
-total_pop = 0
-for lang in languages:
-    speakers = get_language_speakers(lang)
-    total_pop += speakers
-    for letter in lang_letter_frequencies[lang]:
-        if letter in letters_pop:
-            letters_pop[letter] += speakers
-
-weighted_total_letter_frequencies = {}
-for letter, freq in total_letter_frequencies.items():
-    weighted_total_letter_frequencies[letter] = freq * (get_letter_speakers(letter) / total_pop)
-
-lang_mults = {}
-for lang in languages:
-    lang_mults[lang] = 1
-
-letters_list = {}
-for letter in letters_pop:
-    letters_list[letter] = letters_pop[letter]
-
-def get_letter_score(letter, deweighted):
-    total_freq_weighted = 0
-    for lang in get_languages_with_letter(letter):
-        total_freq_weighted += lang_letter_frequencies[lang][letter] * (get_language_speakers(lang) / get_letter_speakers(letter)) * (lang_mults[lang] if deweighted else 1)
-    return get_letter_speakers(letter) * total_freq_weighted * ((config.extra_language_deweight if deweighted else 1) ** (len(get_languages_with_letter(letter))  - 1)) / 1000
-
-scored_letters = {}
-while len(letters_list) > 0:
-    for letter in letters_list:
-        letters_list[letter] = get_letter_score(letter, True)
-
-    all_letters_sorted = sorted(letters_list.items(), key=lambda x: x[1], reverse=True)
-
-    for letter, score in all_letters_sorted:
-       print(f'{letter} score {score} pop. {get_letter_speakers(letter)} freq. {total_letter_frequencies[letter]:.3%} langs: {", ".join(list(map(lang_code_to_name, get_languages_with_letter(letter))))}')
-
-    chosen = all_letters_sorted[0][0]
-    chosen_score = all_letters_sorted[0][1]
-    scored_letters[chosen] = get_letter_score(chosen, False)
-    del letters_list[chosen]
-
-    print(f'chosen {chosen} with total freq {total_letter_frequencies[chosen]} {chosen_score:.0f}: {", ".join(list(map(lang_code_to_name, get_languages_with_letter(chosen))))}')
-    
-    for lang in get_languages_with_letter(chosen):
-        chance_mult = 1 - get_letter_chance(lang, chosen)
-        print(f'deweighting {lang} by mult {chance_mult}: {lang_mults[lang]} to {lang_mults[lang] * chance_mult}')
-        lang_mults[lang] *= chance_mult
-
-with open("results_log.txt", "w", encoding="utf-8") as file:
-    file.write("")
-
-markdown_table_string = (
-    "Rank|Letter|Naive score|Languages|"
-    "\n|----|------|-----------|---------|"
-    "\n"
-)
-anki_csv_string = ""
-valid = 0
-covered_languages = set()
-distinctly_covered_languages = set()
-printAndFileLog("results:")
-for at, (letter, score) in enumerate(scored_letters.items()):
-    valid += 1
-    printAndFileLog(f'{letter} score: {score:.0f} langs: {", ".join(list(map(lang_code_to_name, get_languages_with_letter(letter))))}')
-    anki_csv_string += f'{letter.upper()};{letter};{at};{score:.0f};{", ".join(list(map(lang_code_to_name, get_languages_with_letter(letter))))}\n'
-    markdown_table_string += f'{at + 1}|{letter.upper()} {letter}|{score:.0f}|{", ".join(list(map(lang_code_to_name, get_languages_with_letter(letter))))}|\n'
-    for lang in get_languages_with_letter(letter):
-        covered_languages.add(lang)
-        if len(get_languages_with_letter(letter)) == 1:
-            distinctly_covered_languages.add(lang)
-
-with open("anki_letters.csv", "w", encoding="utf-8") as file:
-    file.write(anki_csv_string)
-
-with open("markdown_table.md", "w", encoding="utf-8") as file:
-    file.write(markdown_table_string)
-
-printAndFileLog(f'listed {len(scored_letters)} letters out of {len(all_letters)} total letters')
-printAndFileLog(f'covered {len(covered_languages)}/{len(languages)} languages: {", ".join(list(map(lang_code_to_name, covered_languages)))}')
-printAndFileLog(f'with distinct converage for {len(distinctly_covered_languages)}/{len(languages)} languages: {", ".join(list(map(lang_code_to_name, distinctly_covered_languages)))}')
-missed_languages = set(languages) - set(covered_languages)
-printAndFileLog(f'missed languages: {", ".join(list(map(lang_code_to_name, missed_languages)))}')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="rank letters by how well they identify Latin-script languages")
+    subparsers = parser.add_subparsers(dest="stage", help="pipeline stage to run (default: all stages in order)")
+    subparsers.add_parser("all", help="run every stage in order")
+    subparsers.add_parser("fetch", help="download the corpora and cache their sentences")
+    subparsers.add_parser("count", help="count letters and save the frequency matrix")
+    subparsers.add_parser("score", help="rank letters from the saved frequency matrix")
+    subparsers.add_parser("export", help="write the results log, Anki CSV and markdown table")
+    subparsers.add_parser("update", help="count only languages added to or removed from the config since the last count, then score and export")
+    sweep_parser = subparsers.add_parser("sweep", help="rank letters for a grid of scoring parameters and compare the results")
+    sweep_parser.add_argument("--max-languages", type=int, nargs="+", default=[config.max_languages])
+    sweep_parser.add_argument("--assumed-text-length", type=int, nargs="+", default=[config.assumed_text_length])
+    sweep_parser.add_argument("--extra-language-deweight", type=float, nargs="+", default=[config.extra_language_deweight])
+    sweep_parser.add_argument("--configs", help="JSON file with a list of parameter sets to use instead of the grid")
+    sweep_parser.add_argument("--output", default="sweep_table.md")
+    trace_parser = subparsers.add_parser("trace", help="print the selection rounds recorded by the last score stage")
+    trace_parser.add_argument("--file", default=tracing.trace_file)
+    trace_parser.add_argument("--verbosity", type=int, default=2, help="1 shows the chosen letters and deweighting, 2 also every candidate's score")
+    evaluate_parser = subparsers.add_parser("evaluate", help="check how well the ranked letters identify the languages of held-out sentences")
+    evaluate_parser.add_argument("--output", default="evaluation_table.md")
+    args = parser.parse_args()
+
+    run_metrics = {}
+    try:
+        with instrumentation.measure(run_metrics):
+            if args.stage is None or args.stage == "all":
+                for name, stage in stages.items():
+                    with instrumentation.measure_stage(name):
+                        stage()
+            elif args.stage == "update":
+                for name, stage in (("update", update_letter_frequencies), ("score", score_letters), ("export", export_results)):
+                    with instrumentation.measure_stage(name):
+                        stage()
+            elif args.stage == "sweep":
+                with instrumentation.measure_stage("sweep"):
+                    sweep_parameters(get_sweep_params(args), args.output)
+            elif args.stage == "trace":
+                tracing.replay_trace(args.file, args.verbosity)
+            elif args.stage == "evaluate":
+                with instrumentation.measure_stage("evaluate"):
+                    evaluate_letters(args.output)
+            else:
+                with instrumentation.measure_stage(args.stage):
+                    stages[args.stage]()
+    finally:
+        instrumentation.write_report(args.stage or "all", run_metrics)
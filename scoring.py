@@ -0,0 +1,63 @@
+import numpy as np
+from frequency_matrix import get_members, sum_languages
+
+
+def get_letter_chance(freq, assumed_text_length):
+    return 1 - (1 - freq) ** assumed_text_length
+
+
+def rank_letters(matrix, candidates, assumed_text_length, extra_language_deweight, on_round=None):
+    # candidates are letter columns of the matrix, ties go to the earlier one
+    letters = matrix["letters"][candidates].tolist()
+    languages = matrix["languages"].tolist()
+    members = get_members(matrix)[:, candidates]
+    frequencies = np.where(members, matrix["frequencies"][:, candidates], 0.0)
+    speakers = matrix["speakers"]
+
+    letter_speakers = (members * speakers[:, None]).sum(axis=0)
+    speaker_shares = np.divide(speakers[:, None], letter_speakers[None, :], out=np.zeros(members.shape), where=letter_speakers[None, :] > 0)
+    weighted_frequencies = frequencies * speaker_shares
+    language_counts = members.sum(axis=0).tolist()
+    deweight_powers = np.array([extra_language_deweight ** (count - 1) if count else 1 for count in language_counts], dtype=np.float64)
+
+    lang_mults = [1] * len(languages)
+    lang_mults_array = np.ones(len(languages))
+
+    def get_letter_scores(columns):
+        total_freq_weighted = sum_languages(weighted_frequencies[:, columns] * lang_mults_array[:, None])
+        return letter_speakers[columns] * total_freq_weighted * deweight_powers[columns] / 1000
+
+    naive_scores = (letter_speakers * sum_languages(weighted_frequencies) / 1000).tolist()
+    scores = get_letter_scores(np.arange(len(letters)))
+    remaining = np.ones(len(letters), dtype=bool)
+
+    scored_letters = {}
+    for _ in range(len(letters)):
+        chosen_column = int(np.argmax(np.where(remaining, scores, -np.inf)))
+        chosen = letters[chosen_column]
+        chosen_score = float(scores[chosen_column])
+        scored_letters[chosen] = naive_scores[chosen_column]
+
+        deweights = []
+        chosen_languages = np.flatnonzero(members[:, chosen_column]).tolist()
+        for lang in chosen_languages:
+            chance_mult = 1 - get_letter_chance(float(frequencies[lang, chosen_column]), assumed_text_length)
+            deweights.append((languages[lang], chance_mult, lang_mults[lang], lang_mults[lang] * chance_mult))
+            lang_mults[lang] *= chance_mult
+            lang_mults_array[lang] = lang_mults[lang]
+
+        if on_round:
+            on_round(
+                {letters[column]: score for column, score in enumerate(scores.tolist()) if remaining[column]},
+                chosen,
+                chosen_score,
+                deweights,
+            )
+        remaining[chosen_column] = False
+
+        # only letters sharing a language with the chosen one change score
+        affected = np.flatnonzero(members[chosen_languages].any(axis=0) & remaining)
+        if len(affected):
+            scores[affected] = get_letter_scores(affected)
+
+    return scored_letters
@@ -0,0 +1,162 @@
+import json
+import math
+import os
+import random
+from itertools import islice
+import numpy as np
+import config
+import sentence_store
+
+# classifies characters by script with a code point lookup table, so whole blocks of text are profiled in one
+# step. letters outside the listed ranges are "other", and everything that is not a letter (spaces, digits,
+# punctuation, combining marks) is "common" and left out of the script shares
+
+script_ranges = {
+    "latin": [(0x0000, 0x02B0), (0x1D00, 0x1DC0), (0x1E00, 0x1F00), (0x2C60, 0x2C80), (0xA720, 0xA800), (0xAB30, 0xAB70), (0xFF21, 0xFF5B)],
+    "greek": [(0x0370, 0x0400), (0x1F00, 0x2000)],
+    "cyrillic": [(0x0400, 0x0530), (0x1C80, 0x1C90), (0x2DE0, 0x2E00), (0xA640, 0xA6A0)],
+    "armenian": [(0x0530, 0x0590), (0xFB13, 0xFB18)],
+    "hebrew": [(0x0590, 0x0600), (0xFB1D, 0xFB50)],
+    "arabic": [(0x0600, 0x0700), (0x0750, 0x0780), (0x08A0, 0x0900), (0xFB50, 0xFE00), (0xFE70, 0xFF00)],
+    "indic": [(0x0900, 0x0E00)],
+    "thai": [(0x0E00, 0x0E80)],
+    "georgian": [(0x10A0, 0x1100), (0x1C90, 0x1CC0), (0x2D00, 0x2D30)],
+    "hangul": [(0x1100, 0x1200), (0x3130, 0x3190), (0xAC00, 0xD7B0)],
+    "ethiopic": [(0x1200, 0x13A0)],
+    "kana": [(0x3040, 0x3100), (0x31F0, 0x3200)],
+    "han": [(0x2E80, 0x2FE0), (0x3400, 0x4DC0), (0x4E00, 0xA000), (0xF900, 0xFB00), (0x20000, 0x30000)],
+}
+script_table_end = 0x30000
+block_lines = 10_000
+
+
+def build_script_table():
+    names = ["common", "other", *script_ranges]
+    # one entry past script_table_end that every higher code point maps to
+    table = np.ones(script_table_end + 1, dtype=np.uint8)
+    for script, ranges in script_ranges.items():
+        for start, end in ranges:
+            table[start:end] = names.index(script)
+    letters = np.array([chr(code_point).isalpha() for code_point in range(script_table_end)] + [True], dtype=bool)
+    table[~letters] = 0
+    return names, table
+
+
+script_names, script_table = build_script_table()
+latin_script = script_names.index("latin")
+
+
+def get_scripts(code_points):
+    return script_table[np.minimum(code_points, np.uint32(script_table_end))]
+
+
+def count_scripts(code_points):
+    return np.bincount(get_scripts(code_points), minlength=len(script_names))
+
+
+def get_code_points(lines):
+    return np.frombuffer("\n".join(lines).encode("utf-32-le"), dtype=np.uint32)
+
+
+def get_latin_share(script_counts):
+    letters = int(script_counts[1:].sum())
+    return int(script_counts[latin_script]) / letters if letters else 0.0
+
+
+def get_script_shares(script_counts):
+    # each script's share of the letters, most used first
+    letters = max(int(script_counts[1:].sum()), 1)
+    shares = {script_names[script]: round(int(script_counts[script]) / letters, 4) for script in np.flatnonzero(script_counts[1:]) + 1}
+    return dict(sorted(shares.items(), key=lambda x: x[1], reverse=True))
+
+
+def filter_latin_sentences(sentences):
+    # keeps the sentences where at least sentence_min_latin_share of the letters are Latin, and those without
+    # letters. every sentence is followed by a newline, so even empty ones have a character to sum
+    scripts = get_scripts(get_code_points(sentences + [""]))
+    lengths = np.fromiter(map(len, sentences), dtype=np.intp, count=len(sentences))
+    starts = np.cumsum(lengths + 1) - lengths - 1
+    letters = np.add.reduceat(scripts > 0, starts, dtype=np.int32)
+    latin = np.add.reduceat(scripts == latin_script, starts, dtype=np.int32)
+    keep = latin >= config.sentence_min_latin_share * letters
+    return [sentence for sentence, kept in zip(sentences, keep.tolist()) if kept]
+
+
+def new_reservoir(size, seed=0):
+    # a uniform sample of `size` lines from a stream of unknown length
+    return {"size": size, "lines": [], "seen": 0, "next": None, "weight": 1.0, "random": random.Random(seed)}
+
+
+def skip_reservoir(reservoir):
+    # Algorithm L: the index of the next line that replaces one in the sample, the lines before it are not looked at
+    rng = reservoir["random"]
+    reservoir["weight"] *= math.exp(math.log(1 - rng.random()) / reservoir["size"])
+    reservoir["next"] += math.floor(math.log(1 - rng.random()) / math.log(1 - reservoir["weight"])) + 1
+
+
+def add_to_reservoir(reservoir, lines):
+    size = reservoir["size"]
+    sample = reservoir["lines"]
+    start = reservoir["seen"]
+    reservoir["seen"] += len(lines)
+    if len(sample) < size:
+        sample.extend(lines[:size - len(sample)])
+        if len(sample) < size:
+            return
+        reservoir["next"] = size - 1
+        skip_reservoir(reservoir)
+    while reservoir["next"] < reservoir["seen"]:
+        sample[reservoir["random"].randrange(size)] = lines[reservoir["next"] - start]
+        skip_reservoir(reservoir)
+
+
+def profile_sentences_file(sentences_file):
+    # script counts of script_sample_sentences lines spread over the whole file: picked at random from the
+    # sentence store when there is one, otherwise reservoir sampled while streaming the file
+    store = sentence_store.open_store(sentences_file) if config.use_sentence_store else None
+    if store is not None:
+        sample_size = min(config.script_sample_sentences, store["sentences"])
+        lines = np.sort(np.random.default_rng(0).choice(store["sentences"], sample_size, replace=False))
+        return count_scripts(sentence_store.gather_lines(store, lines))
+
+    reservoir = new_reservoir(config.script_sample_sentences)
+    with open(sentences_file, "r", encoding="utf-8") as file:
+        while block := list(islice(file, block_lines)):
+            add_to_reservoir(reservoir, block)
+    return count_scripts(get_code_points(reservoir["lines"]))
+
+
+def get_profile_file(sentences_file):
+    return os.path.splitext(sentences_file)[0] + ".scripts.json"
+
+
+def save_script_profile(sentences_file, script_counts):
+    with open(get_profile_file(sentences_file), "w", encoding="utf-8") as file:
+        json.dump({
+            "source": sentence_store.get_source_stat(sentences_file),
+            "scripts": {script_names[script]: int(script_counts[script]) for script in np.flatnonzero(script_counts)},
+        }, file)
+
+
+def load_script_profile(sentences_file):
+    # saved script counts, None when missing or saved for another version of the file
+    profile_file = get_profile_file(sentences_file)
+    if not os.path.exists(profile_file):
+        return None
+    try:
+        with open(profile_file, "r", encoding="utf-8") as file:
+            profile = json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"error reading script profile {profile_file}: {e}")
+        return None
+    if profile.get("source") != sentence_store.get_source_stat(sentences_file):
+        return None
+    return np.array([profile["scripts"].get(script, 0) for script in script_names], dtype=np.int64)
+
+
+def get_script_profile(sentences_file):
+    script_counts = load_script_profile(sentences_file)
+    if script_counts is None:
+        script_counts = profile_sentences_file(sentences_file)
+        save_script_profile(sentences_file, script_counts)
+    return script_counts
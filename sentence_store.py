@@ -0,0 +1,194 @@
+import argparse
+import codecs
+import glob
+import hashlib
+import io
+import json
+import os
+import unicodedata
+import numpy as np
+import config
+
+# a sentences file kept as a code point array in the narrowest of uint8, uint16 or uint32 that holds all of its
+# characters (like python strings), plus the offset of every line. both are memory-mapped, so a range of lines is a
+# slice counting reads without decoding and sentence N is found in O(1). the characters are stored normalized the
+# way counting reads them (NFC with full_latin_range), so no mode has to decode a slice. the text file stays the
+# source: a store is only used while the file's size and modification time, and the normalization, match the ones
+# it was built with
+
+sentences_folder = "corpora_files_extracted"
+store_version = 2
+# bytes of the sentences file read at a time when building a store
+build_chunk_bytes = 1 << 20
+
+
+def get_store_paths(sentences_file):
+    base = os.path.splitext(sentences_file)[0]
+    return base + ".codepoints.npy", base + ".offsets.npy", base + ".store.json"
+
+
+def get_source_stat(sentences_file):
+    stat = os.stat(sentences_file)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def get_normalization():
+    # counting the full Latin range composes decomposed diacritics first
+    return "NFC" if config.full_latin_range else None
+
+
+def read_code_point_chunks(sentences_file, normalization=None, hasher=None):
+    # the file's characters in chunks, with "\r\n" and "\r" turned into "\n" like reading it in text mode. when
+    # normalizing, a chunk ends at its last newline so no character is split from its combining marks
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+    pending = ""
+    with open(sentences_file, "rb") as file:
+        while True:
+            data = file.read(build_chunk_bytes)
+            if hasher is not None:
+                hasher.update(data)
+            text = decoder.decode(data, final=not data)
+            if normalization:
+                text = pending + text
+                end = text.rfind("\n") + 1 if data else len(text)
+                text, pending = unicodedata.normalize(normalization, text[:end]), text[end:]
+            if text:
+                yield np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+            if not data:
+                break
+
+
+def build_store(sentences_file):
+    # two streaming passes, so memory stays at one chunk: the first finds the array sizes and the narrowest dtype,
+    # the second appends the chunks to the .npy files
+    code_points_file, offsets_file, metadata_file = get_store_paths(sentences_file)
+    source_stat = get_source_stat(sentences_file)
+    normalization = get_normalization()
+    hasher = hashlib.sha256()
+    length = 0
+    newlines = 0
+    max_code_point = 0
+    for code_points in read_code_point_chunks(sentences_file, normalization, hasher):
+        length += len(code_points)
+        newlines += int(np.count_nonzero(code_points == ord("\n")))
+        max_code_point = max(max_code_point, int(code_points.max()))
+    dtype = np.uint8 if max_code_point <= 0xFF else np.uint16 if max_code_point <= 0xFFFF else np.uint32
+
+    # the metadata is written last, an interrupted build leaves no store that looks valid
+    if os.path.exists(metadata_file):
+        os.remove(metadata_file)
+    # offsets[i] is where line i starts, the end of the last line is one past the array like after a newline
+    with open(code_points_file, "wb") as code_points_output, open(offsets_file, "wb") as offsets_output:
+        np.lib.format.write_array_header_1_0(code_points_output, {"descr": np.dtype(dtype).str, "fortran_order": False, "shape": (length,)})
+        np.lib.format.write_array_header_1_0(offsets_output, {"descr": np.dtype(np.int64).str, "fortran_order": False, "shape": (newlines + 2,)})
+        offsets_output.write(np.zeros(1, dtype=np.int64).tobytes())
+        position = 0
+        lines = 1
+        for code_points in read_code_point_chunks(sentences_file, normalization):
+            line_starts = np.flatnonzero(code_points == ord("\n")) + position + 1
+            position += len(code_points)
+            lines += len(line_starts)
+            code_points_output.write(code_points.astype(dtype).tobytes())
+            offsets_output.write(line_starts.astype(np.int64).tobytes())
+        offsets_output.write(np.array([length + 1], dtype=np.int64).tobytes())
+    if position != length or lines != newlines + 1:
+        raise Exception(f'{sentences_file} changed while building its sentence store')
+
+    metadata = {
+        "version": store_version,
+        "source": source_stat,
+        "sentences": newlines + 1,
+        "dtype": np.dtype(dtype).name,
+        "normalization": normalization,
+        "sha256": hasher.hexdigest(),
+    }
+    with open(metadata_file + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(metadata, file)
+    os.replace(metadata_file + ".tmp", metadata_file)
+    return open_store(sentences_file)
+
+
+def open_store(sentences_file):
+    # the memory-mapped store of a sentences file, None when there is none, it is outdated or it was normalized
+    # for another full_latin_range
+    code_points_file, offsets_file, metadata_file = get_store_paths(sentences_file)
+    if not os.path.exists(metadata_file) or not os.path.exists(sentences_file):
+        return None
+    try:
+        with open(metadata_file, "r", encoding="utf-8") as file:
+            metadata = json.load(file)
+        if metadata.get("version") != store_version or metadata.get("source") != get_source_stat(sentences_file) or metadata.get("normalization") != get_normalization():
+            return None
+        return {
+            **metadata,
+            "code_points": np.load(code_points_file, mmap_mode="r"),
+            "offsets": np.load(offsets_file, mmap_mode="r"),
+        }
+    except (OSError, ValueError) as e:
+        print(f"error reading sentence store of {sentences_file}: {e}")
+        return None
+
+
+def update_store(sentences_file):
+    store = open_store(sentences_file)
+    if store is None:
+        store = build_store(sentences_file)
+        print(f'saved sentence store of {store["sentences"]} sentences to: {get_store_paths(sentences_file)[0]}')
+    return store
+
+
+def get_lines(store, start, end):
+    # code points of lines start to end, newlines included, the same characters as joining those lines read from the file
+    code_points = store["code_points"]
+    return code_points[store["offsets"][start]:min(store["offsets"][end], len(code_points))]
+
+
+def gather_lines(store, lines):
+    # code points of the given lines joined in order, for lines spread over the file
+    code_points = store["code_points"]
+    starts = store["offsets"][lines]
+    lengths = np.minimum(store["offsets"][lines + 1], len(code_points)) - starts
+    positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+    return code_points[positions]
+
+
+def decode(code_points):
+    if code_points.dtype == np.uint8:
+        return code_points.tobytes().decode("latin-1")
+    if code_points.dtype == np.uint16:
+        return code_points.astype("<u2", copy=False).tobytes().decode("utf-16-le")
+    return code_points.astype("<u4", copy=False).tobytes().decode("utf-32-le")
+
+
+def get_sentence(store, index):
+    offsets = store["offsets"]
+    return decode(store["code_points"][offsets[index]:offsets[index + 1] - 1])
+
+
+def get_text(store, start, end):
+    return decode(get_lines(store, start, end))
+
+
+def convert_sentences_files(languages):
+    # builds the stores of already cached sentences files, every file in the corpora folder without languages
+    if languages:
+        sentences_files = [os.path.join(sentences_folder, f"{language}_sentences.txt") for language in languages]
+    else:
+        sentences_files = sorted(glob.glob(os.path.join(sentences_folder, "*_sentences.txt")))
+    text_bytes = 0
+    store_bytes = 0
+    for sentences_file in sentences_files:
+        if not os.path.exists(sentences_file):
+            raise Exception(f'sentences file not found: {sentences_file}')
+        store = update_store(sentences_file)
+        text_bytes += os.path.getsize(sentences_file)
+        store_bytes += sum(os.path.getsize(path) for path in get_store_paths(sentences_file))
+        print(f'{sentences_file}: {store["sentences"]} sentences as {store["dtype"]}')
+    print(f'{len(sentences_files)} stores, {store_bytes / 1e6:.1f} MB for {text_bytes / 1e6:.1f} MB of text')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="convert cached sentences files to memory-mapped sentence stores")
+    parser.add_argument("languages", nargs="*", help="language codes, every cached sentences file by default")
+    args = parser.parse_args()
+    convert_sentences_files(args.languages)
@@ -0,0 +1,71 @@
+import os
+import config
+import instrumentation
+
+language_speakers = {}
+
+
+def read_language_speakers(code):
+    file_path = os.path.join("speakers", code + ".txt")
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "r", encoding="utf-8") as file:
+        content = file.read().strip()
+    # older runs wrote "None" for languages Wikidata had no count for, treat those as missing
+    if not content.isdigit():
+        print(f"ignoring invalid speaker count in {file_path}: {content!r}")
+        return None
+    return int(content)
+
+
+def fetch_languages_speakers(codes):
+    import requests
+
+    values = " ".join(f"'{code}'" for code in codes)
+    query = f"""
+    SELECT ?code (MAX(?speakers) AS ?maxSpeakers) WHERE {{
+        VALUES ?code {{ {values} }}
+        ?lang wdt:P219 ?code.
+        ?lang wdt:P1098 ?speakers.
+    }}
+    GROUP BY ?code
+    """
+    headers = {"Accept": "application/json", "user-agent": "python-bot"}
+    print(f"fetching speaker counts for {len(codes)} languages from Wikidata")
+    response = requests.get(config.wikidata_sparql_url, params={"query": query, "format": "json"}, headers=headers)
+    instrumentation.add_counter("http_requests")
+    instrumentation.add_counter("http_bytes", len(response.content))
+
+    if response.status_code != 200:
+        raise Exception(f"Error: {response.status_code}, {response.text}")
+
+    speakers = {}
+    for binding in response.json().get("results", {}).get("bindings", []):
+        speakers[binding["code"]["value"]] = int(float(binding["maxSpeakers"]["value"]))
+    return speakers
+
+
+def load_language_speakers(codes, allow_missing=False):
+    missing_codes = []
+    for code in codes:
+        if code in language_speakers:
+            continue
+        speakers = read_language_speakers(code)
+        if speakers is None:
+            missing_codes.append(code)
+        else:
+            language_speakers[code] = speakers
+
+    if missing_codes:
+        fetched_speakers = fetch_languages_speakers(missing_codes)
+        os.makedirs("speakers", exist_ok=True)
+        for code, speakers in fetched_speakers.items():
+            with open(os.path.join("speakers", code + ".txt"), "w", encoding="utf-8") as file:
+                file.write(str(speakers))
+            language_speakers[code] = speakers
+
+        unknown_codes = [code for code in missing_codes if code not in fetched_speakers]
+        if unknown_codes and not allow_missing:
+            raise Exception(f'no speaker count on Wikidata for {", ".join(unknown_codes)}, write one to speakers/<code>.txt manually')
+
+    return {code: language_speakers[code] for code in codes if code in language_speakers}
@@ -0,0 +1,59 @@
+import json
+
+# records the greedy selection rounds of the score stage as JSON lines: a header with everything that stays the same
+# across rounds (candidate letters with their speakers, total frequency and languages, and language names), then one
+# line per round with the scores of the letters still remaining, the chosen letter and the deweighted languages
+
+trace_file = "selection_trace.jsonl"
+trace_buffer_size = 1 << 16
+
+
+def open_trace(file_path, header):
+    file = open(file_path, "w", encoding="utf-8", buffering=trace_buffer_size)
+    file.write(json.dumps({"type": "header", **header}, ensure_ascii=False) + "\n")
+    return file
+
+
+def write_round(file, round_record):
+    file.write(json.dumps({"type": "round", **round_record}, ensure_ascii=False) + "\n")
+
+
+def read_trace(file_path):
+    with open(file_path, "r", encoding="utf-8") as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    if not records or records[0]["type"] != "header":
+        raise Exception(f'{file_path} is not a selection trace')
+    return records[0], [record for record in records[1:] if record["type"] == "round"]
+
+
+def format_round(header, remaining, round_record, verbosity):
+    # the lines the score stage prints for one round, verbosity 1 leaves out the candidate list
+    letter_info = header["letters"]
+    names = header["language_names"]
+
+    def language_names(letter):
+        return ", ".join(names[lang] for lang in letter_info[letter]["languages"])
+
+    lines = []
+    if verbosity >= 2:
+        scores = dict(zip(remaining, round_record["scores"]))
+        for letter, score in sorted(scores.items(), key=lambda x: x[1], reverse=True):
+            info = letter_info[letter]
+            lines.append(f'{letter} score {score} pop. {info["speakers"]} freq. {info["frequency"]:.3%} langs: {language_names(letter)}')
+
+    if verbosity >= 1:
+        chosen = round_record["chosen"]
+        lines.append(f'chosen {chosen} with total freq {letter_info[chosen]["frequency"]} {round_record["score"]:.0f}: {language_names(chosen)}')
+        for lang, chance_mult, old_mult, new_mult in round_record["deweights"]:
+            lines.append(f'deweighting {lang} by mult {chance_mult}: {old_mult} to {new_mult}')
+    return lines
+
+
+def replay_trace(file_path, verbosity):
+    header, rounds = read_trace(file_path)
+    remaining = list(header["candidates"])
+    for round_record in rounds:
+        lines = format_round(header, remaining, round_record, verbosity)
+        if lines:
+            print("\n".join(lines))
+        remaining.remove(round_record["chosen"])